@@ -1,24 +1,53 @@
 """
 JWT аутентификация и управление пользователями
 """
+import asyncio
+import time
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime, timedelta
-from typing import Optional
+from typing import Optional, Dict, Any
 from jose import JWTError, jwt
 import bcrypt
 from fastapi import Depends, HTTPException, status
 from fastapi.security import OAuth2PasswordBearer
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.orm import Session
 from pydantic import BaseModel
 import os
 
-from database import get_db
+from database import get_async_db
 from models import User
+from utils.cache import MemoryCache
 
 # Конфигурация
 SECRET_KEY = os.getenv("JWT_SECRET_KEY", "your-secret-key-change-in-production")
 ALGORITHM = "HS256"
 ACCESS_TOKEN_EXPIRE_MINUTES = 60 * 24 * 7  # 7 дней
 
+# Кеш пользователей по subject токена (убирает запрос к users на каждый вызов API)
+AUTH_USER_CACHE_TTL = int(os.getenv("AUTH_USER_CACHE_TTL", "60"))
+AUTH_USER_CACHE_SIZE = int(os.getenv("AUTH_USER_CACHE_SIZE", "1000"))
+
+_user_cache = MemoryCache(max_entries=AUTH_USER_CACHE_SIZE)
+
+# bcrypt: стоимость хеширования и пул потоков (event loop не блокируется)
+BCRYPT_ROUNDS = int(os.getenv("BCRYPT_ROUNDS", "12"))
+BCRYPT_MAX_WORKERS = int(os.getenv("BCRYPT_MAX_WORKERS", "2"))
+BCRYPT_MAX_PENDING = int(os.getenv("BCRYPT_MAX_PENDING", "64"))  # больше - 503
+
+_password_executor = ThreadPoolExecutor(max_workers=BCRYPT_MAX_WORKERS, thread_name_prefix="bcrypt")
+_password_metrics = {
+    "hash_calls": 0,
+    "verify_calls": 0,
+    "rejected": 0,
+    "in_flight": 0,
+    "max_in_flight": 0,
+    "total_wait_seconds": 0.0,
+    "total_work_seconds": 0.0,
+    "max_work_seconds": 0.0
+}
+
 # OAuth2 схема
 oauth2_scheme = OAuth2PasswordBearer(tokenUrl="/api/auth/login")
 
@@ -57,7 +86,69 @@ def verify_password(plain_password: str, hashed_password: str) -> bool:
 
 def get_password_hash(password: str) -> str:
     """Хеширование пароля"""
-    return bcrypt.hashpw(password.encode('utf-8'), bcrypt.gensalt()).decode('utf-8')
+    return bcrypt.hashpw(password.encode('utf-8'), bcrypt.gensalt(rounds=BCRYPT_ROUNDS)).decode('utf-8')
+
+
+def _timed(func, *args):
+    """Выполнение в потоке пула с замером времени работы"""
+    started = time.perf_counter()
+    result = func(*args)
+    return result, time.perf_counter() - started
+
+
+async def _run_password_task(kind: str, func, *args):
+    """
+    Выполнение bcrypt в пуле потоков с ограничением очереди
+
+    Если в работе и очереди уже BCRYPT_MAX_PENDING операций,
+    запрос отклоняется с 503, чтобы всплеск логинов не копил задержку.
+    """
+    metrics = _password_metrics
+    if metrics["in_flight"] >= BCRYPT_MAX_PENDING:
+        metrics["rejected"] += 1
+        raise HTTPException(
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+            detail="Too many authentication requests, please retry"
+        )
+
+    metrics[f"{kind}_calls"] += 1
+    metrics["in_flight"] += 1
+    metrics["max_in_flight"] = max(metrics["max_in_flight"], metrics["in_flight"])
+    started = time.perf_counter()
+    try:
+        loop = asyncio.get_running_loop()
+        result, work_seconds = await loop.run_in_executor(_password_executor, _timed, func, *args)
+    finally:
+        metrics["in_flight"] -= 1
+
+    metrics["total_work_seconds"] += work_seconds
+    metrics["total_wait_seconds"] += time.perf_counter() - started - work_seconds
+    metrics["max_work_seconds"] = max(metrics["max_work_seconds"], work_seconds)
+    return result
+
+
+async def verify_password_async(plain_password: str, hashed_password: str) -> bool:
+    """Проверка пароля в пуле потоков"""
+    return await _run_password_task("verify", verify_password, plain_password, hashed_password)
+
+
+async def get_password_hash_async(password: str) -> str:
+    """Хеширование пароля в пуле потоков"""
+    return await _run_password_task("hash", get_password_hash, password)
+
+
+def get_password_metrics() -> Dict[str, Any]:
+    """Метрики пула bcrypt"""
+    metrics = dict(_password_metrics)
+    calls = metrics["hash_calls"] + metrics["verify_calls"]
+    metrics.update({
+        "rounds": BCRYPT_ROUNDS,
+        "max_workers": BCRYPT_MAX_WORKERS,
+        "max_pending": BCRYPT_MAX_PENDING,
+        "avg_wait_seconds": round(metrics["total_wait_seconds"] / calls, 4) if calls else 0.0,
+        "avg_work_seconds": round(metrics["total_work_seconds"] / calls, 4) if calls else 0.0
+    })
+    return metrics
 
 
 # JWT функции
@@ -95,33 +186,54 @@ def decode_token(token: str) -> TokenData:
 # Dependency для получения текущего пользователя
 async def get_current_user(
     token: str = Depends(oauth2_scheme),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_async_db)
 ) -> User:
     """Получить текущего авторизованного пользователя"""
     token_data = decode_token(token)
 
-    user = db.query(User).filter(User.username == token_data.username).first()
+    # Пользователь из кеша (объект не привязан к сессии)
+    cached = _user_cache.get(token_data.username)
+    if cached is not None:
+        return User(**cached)
+
+    result = await db.execute(select(User).where(User.username == token_data.username))
+    user = result.scalar_one_or_none()
     if user is None:
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
             detail="User not found"
         )
 
+    _user_cache.set(token_data.username, {
+        "id": user.id,
+        "username": user.username,
+        "email": user.email,
+        "created_at": user.created_at
+    }, AUTH_USER_CACHE_TTL)
+
     return user
 
 
+def invalidate_cached_user(username: Optional[str] = None) -> None:
+    """Сброс кеша пользователя (или всех пользователей) после изменения users"""
+    if username is None:
+        _user_cache.clear()
+    else:
+        _user_cache.delete(username)
+
+
 # Функции работы с пользователями
-def authenticate_user(db: Session, username: str, password: str) -> Optional[User]:
+async def authenticate_user(db: Session, username: str, password: str) -> Optional[User]:
     """Аутентификация пользователя"""
     user = db.query(User).filter(User.username == username).first()
     if not user:
         return None
-    if not verify_password(password, user.password_hash):
+    if not await verify_password_async(password, user.password_hash):
         return None
     return user
 
 
-def create_user(db: Session, user_data: UserCreate) -> User:
+async def create_user(db: Session, user_data: UserCreate) -> User:
     """Создание нового пользователя"""
     # Проверка существования
     existing = db.query(User).filter(
@@ -136,7 +248,7 @@ def create_user(db: Session, user_data: UserCreate) -> User:
         )
 
     # Создание пользователя
-    hashed_password = get_password_hash(user_data.password)
+    hashed_password = await get_password_hash_async(user_data.password)
     db_user = User(
         username=user_data.username,
         email=user_data.email,
@@ -1,12 +1,20 @@
 """
 Конфигурация базы данных PostgreSQL
 """
-from sqlalchemy import create_engine
+from sqlalchemy import create_engine, text, inspect
+from sqlalchemy.exc import DBAPIError
+from sqlalchemy.engine import make_url
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker, create_async_engine
 from sqlalchemy.ext.declarative import declarative_base
-from sqlalchemy.orm import sessionmaker
-from sqlalchemy.pool import QueuePool
+from sqlalchemy.orm import Session, sessionmaker
+from sqlalchemy.pool import QueuePool, AsyncAdaptedQueuePool
+import json
 import os
+import time
 from dotenv import load_dotenv
+from loguru import logger
+
+from utils.pool_metrics import get_pool_metrics, instrument_engine, instrumented_pool_class
 
 # Загружаем .env только если файл существует (для локальной разработки)
 if os.path.exists(".env"):
@@ -23,35 +31,246 @@ DATABASE_URL = os.getenv(
 if DATABASE_URL.startswith("postgres://"):
     DATABASE_URL = DATABASE_URL.replace("postgres://", "postgresql://", 1)
 
+# Реплика только для чтения (необязательно): тяжелые запросы чтения уходят на нее
+DATABASE_REPLICA_URL = os.getenv("DATABASE_REPLICA_URL") or None
+if DATABASE_REPLICA_URL and DATABASE_REPLICA_URL.startswith("postgres://"):
+    DATABASE_REPLICA_URL = DATABASE_REPLICA_URL.replace("postgres://", "postgresql://", 1)
+
+# Сколько секунд не обращаться к реплике после ошибки подключения
+REPLICA_RETRY_SECONDS = int(os.getenv("REPLICA_RETRY_SECONDS", "30"))
+
+# Настройки пула соединений (одинаковые для синхронного и асинхронного engine)
+DB_POOL_SIZE = int(os.getenv("DB_POOL_SIZE", "5"))
+DB_MAX_OVERFLOW = int(os.getenv("DB_MAX_OVERFLOW", "10"))
+DB_POOL_TIMEOUT = float(os.getenv("DB_POOL_TIMEOUT", "30"))  # Таймаут ожидания соединения
+DB_POOL_RECYCLE = int(os.getenv("DB_POOL_RECYCLE", "3600"))  # Переподключение каждый час
+# Проверка соединения перед выдачей (лишний round trip на каждый checkout)
+DB_POOL_PRE_PING = os.getenv("DB_POOL_PRE_PING", "true").lower() in ("1", "true", "yes")
+
+POOL_SETTINGS = {
+    "pool_size": DB_POOL_SIZE,
+    "max_overflow": DB_MAX_OVERFLOW,
+    "pool_timeout": DB_POOL_TIMEOUT,
+    "pool_recycle": DB_POOL_RECYCLE,
+}
+
+def json_serializer(value) -> str:
+    """JSON колонок без \\u-экранирования: кириллица хранится компактно, пути JSON работают в SQLite"""
+    return json.dumps(value, ensure_ascii=False)
+
+
+def get_connect_args(url: str) -> dict:
+    """connect_args синхронного engine"""
+    # sslmode - параметр psycopg2, другие драйверы (SQLite) его не принимают
+    if make_url(url).get_backend_name() != "postgresql":
+        return {}
+
+    # Railway PostgreSQL обычно требует SSL, но не всегда
+    # Если в URL уже есть sslmode, не переопределяем
+    if "sslmode" not in url.lower():
+        # Пробуем prefer (не требует, но использует если доступно)
+        return {"sslmode": "prefer"}
+    return {}
+
+
 # Создание engine с пулом соединений
-# Добавляем connect_args для лучшей обработки ошибок
-connect_args = {}
-# Railway PostgreSQL обычно требует SSL, но не всегда
-# Если в URL уже есть sslmode, не переопределяем
-if "sslmode" not in DATABASE_URL.lower():
-    # Пробуем prefer (не требует, но использует если доступно)
-    connect_args = {"sslmode": "prefer"}
+connect_args = get_connect_args(DATABASE_URL)
 
 engine = create_engine(
     DATABASE_URL,
-    poolclass=QueuePool,
-    pool_size=5,
-    max_overflow=10,
-    pool_pre_ping=True,  # Проверка соединения перед использованием
+    poolclass=instrumented_pool_class(QueuePool, get_pool_metrics("primary")),
+    pool_pre_ping=DB_POOL_PRE_PING,
     echo=False,  # Логирование SQL запросов (для дебага)
+    json_serializer=json_serializer,
     connect_args=connect_args,
-    # Увеличиваем таймауты для Railway
-    pool_recycle=3600,  # Переподключение каждый час
-    pool_timeout=30,  # Таймаут ожидания соединения
+    **POOL_SETTINGS
 )
+instrument_engine(engine, get_pool_metrics("primary"))
 
 # Session maker
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 
+# Engine реплики (None, если DATABASE_REPLICA_URL не задан)
+replica_engine = None
+ReplicaSessionLocal = None
+if DATABASE_REPLICA_URL:
+    replica_engine = create_engine(
+        DATABASE_REPLICA_URL,
+        poolclass=instrumented_pool_class(QueuePool, get_pool_metrics("replica")),
+        pool_pre_ping=DB_POOL_PRE_PING,
+        echo=False,
+        json_serializer=json_serializer,
+        connect_args=get_connect_args(DATABASE_REPLICA_URL),
+        **POOL_SETTINGS
+    )
+    instrument_engine(replica_engine, get_pool_metrics("replica"))
+    ReplicaSessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=replica_engine)
+
 # Base для моделей
 Base = declarative_base()
 
 
+def get_async_database_url(url: str):
+    """
+    URL и connect_args для асинхронного драйвера
+
+    postgresql:// -> postgresql+asyncpg:// (sslmode переносится в аргумент ssl,
+    asyncpg не понимает его в URL), sqlite:// -> sqlite+aiosqlite://.
+
+    Returns:
+        Tuple[URL, connect_args]
+    """
+    async_url = make_url(url)
+    connect_args = {}
+
+    if async_url.get_backend_name() == "postgresql":
+        connect_args["ssl"] = async_url.query.get("sslmode", "prefer")
+        async_url = async_url.set(drivername="postgresql+asyncpg").difference_update_query(["sslmode"])
+    elif async_url.get_backend_name() == "sqlite":
+        async_url = async_url.set(drivername="sqlite+aiosqlite")
+
+    return async_url, connect_args
+
+
+# Асинхронные engine'ы создаются при первом обращении (нужен драйвер asyncpg)
+_async_engine = None
+_async_session_factory = None
+_async_replica_engine = None
+_async_replica_session_factory = None
+
+
+def _create_async_engine(url: str, metrics_name: str):
+    """Асинхронный engine (те же настройки пула, что и у синхронного)"""
+    async_url, async_connect_args = get_async_database_url(url)
+    metrics = get_pool_metrics(metrics_name)
+    pool_args = {}
+    if async_url.get_backend_name() != "sqlite":
+        pool_args = dict(
+            POOL_SETTINGS,
+            poolclass=instrumented_pool_class(AsyncAdaptedQueuePool, metrics)
+        )
+    async_engine = create_async_engine(
+        async_url,
+        pool_pre_ping=DB_POOL_PRE_PING,
+        echo=False,
+        json_serializer=json_serializer,
+        connect_args=async_connect_args,
+        **pool_args
+    )
+    instrument_engine(async_engine.sync_engine, metrics)
+    return async_engine
+
+
+def get_async_engine():
+    """Асинхронный engine основной БД"""
+    global _async_engine
+    if _async_engine is None:
+        _async_engine = _create_async_engine(DATABASE_URL, "primary_async")
+    return _async_engine
+
+
+def get_async_sessionmaker():
+    """Фабрика AsyncSession"""
+    global _async_session_factory
+    if _async_session_factory is None:
+        _async_session_factory = async_sessionmaker(
+            get_async_engine(),
+            class_=AsyncSession,
+            autoflush=False,
+            expire_on_commit=False
+        )
+    return _async_session_factory
+
+
+def get_async_replica_sessionmaker():
+    """Фабрика AsyncSession реплики (только при заданном DATABASE_REPLICA_URL)"""
+    global _async_replica_engine, _async_replica_session_factory
+    if _async_replica_session_factory is None:
+        _async_replica_engine = _create_async_engine(DATABASE_REPLICA_URL, "replica_async")
+        _async_replica_session_factory = async_sessionmaker(
+            _async_replica_engine,
+            class_=AsyncSession,
+            autoflush=False,
+            expire_on_commit=False
+        )
+    return _async_replica_session_factory
+
+
+async def dispose_async_engine():
+    """Закрытие соединений асинхронных пулов (при выключении)"""
+    global _async_engine, _async_session_factory, _async_replica_engine, _async_replica_session_factory
+    for async_engine in (_async_engine, _async_replica_engine):
+        if async_engine is not None:
+            await async_engine.dispose()
+    _async_engine = None
+    _async_session_factory = None
+    _async_replica_engine = None
+    _async_replica_session_factory = None
+
+
+# Изменения схемы для уже существующих таблиц (create_all не добавляет колонки)
+SCHEMA_UPDATES = [
+    "ALTER TABLE ingestion_jobs ADD COLUMN IF NOT EXISTS stats JSON",
+    "ALTER TABLE records ADD COLUMN IF NOT EXISTS row_hash VARCHAR(64)",
+    "CREATE INDEX IF NOT EXISTS idx_records_file_hash ON records (file_id, row_hash)",
+    "CREATE INDEX IF NOT EXISTS idx_records_row_hash ON records (row_hash)",
+    # Индекс keyset пагинации в порядке сортировки записей (вместо (date_field, id))
+    "DROP INDEX IF EXISTS idx_records_date_id",
+    "CREATE INDEX IF NOT EXISTS idx_records_date_desc_id ON records (date_field DESC NULLS LAST, id DESC)",
+    # search_text существующих записей заполняется в фоне (utils/search_backfill.py)
+    "ALTER TABLE records ADD COLUMN IF NOT EXISTS search_text TEXT",
+    "CREATE INDEX IF NOT EXISTS idx_records_search_trgm ON records USING gin (search_text gin_trgm_ops)",
+    # Записи, ожидающие заполнения search_text: после заполнения индекс пуст,
+    # и заполнение при следующих запусках не просматривает таблицу
+    "CREATE INDEX IF NOT EXISTS idx_records_search_pending ON records (id) "
+    "WHERE data IS NOT NULL AND (search_text IS NULL OR search_text LIKE '{%')",
+    "ALTER TABLE files ADD COLUMN IF NOT EXISTS content_hash VARCHAR(64)",
+    "CREATE INDEX IF NOT EXISTS idx_files_user_content_hash ON files (user_id, content_hash)",
+    "ALTER TABLE ingestion_jobs ADD COLUMN IF NOT EXISTS content_hash VARCHAR(64)",
+    "ALTER TABLE ingestion_jobs ADD COLUMN IF NOT EXISTS kind VARCHAR(20) NOT NULL DEFAULT 'ingest'",
+    # Типизированное хранение: значения массивом, data только для STORAGE_MODE=json
+    "ALTER TABLE records ADD COLUMN IF NOT EXISTS cells JSONB",
+    "ALTER TABLE records ALTER COLUMN data DROP NOT NULL",
+    "ALTER TABLE files ADD COLUMN IF NOT EXISTS column_types JSON",
+    # Пакетная загрузка: отдельный файл (и задача) на каждый лист книги
+    "ALTER TABLE files ADD COLUMN IF NOT EXISTS sheet_name VARCHAR(255)",
+    "ALTER TABLE ingestion_jobs ADD COLUMN IF NOT EXISTS sheet_name VARCHAR(255)",
+    # Живость задач между процессами API: владелец и отметка heartbeat
+    "ALTER TABLE ingestion_jobs ADD COLUMN IF NOT EXISTS owner VARCHAR(255)",
+    "ALTER TABLE ingestion_jobs ADD COLUMN IF NOT EXISTS heartbeat_at TIMESTAMP WITH TIME ZONE",
+    # Одна активная задача на лист: старые дубли активных задач снимаются перед созданием индекса
+    "UPDATE ingestion_jobs SET status = 'failed', error = 'Superseded by a newer upload', finished_at = now() "
+    "WHERE status IN ('pending', 'running') AND content_hash IS NOT NULL AND id NOT IN ("
+    "SELECT max(id) FROM ingestion_jobs WHERE status IN ('pending', 'running') AND content_hash IS NOT NULL "
+    "GROUP BY user_id, content_hash, coalesce(sheet_name, ''))",
+    "CREATE UNIQUE INDEX IF NOT EXISTS uq_jobs_active_upload ON ingestion_jobs (user_id, content_hash, coalesce(sheet_name, '')) "
+    "WHERE status IN ('pending', 'running') AND content_hash IS NOT NULL",
+]
+
+
+def ensure_extensions():
+    """
+    Расширения PostgreSQL, нужные индексам моделей (pg_trgm - поиск)
+    """
+    if engine.dialect.name != "postgresql":
+        return
+
+    with engine.begin() as conn:
+        conn.execute(text("CREATE EXTENSION IF NOT EXISTS pg_trgm"))
+
+
+def apply_schema_updates():
+    """
+    Применение SCHEMA_UPDATES (только PostgreSQL, идемпотентно)
+    """
+    if engine.dialect.name != "postgresql":
+        return
+
+    with engine.begin() as conn:
+        for statement in SCHEMA_UPDATES:
+            conn.execute(text(statement))
+
+
 def get_db():
     """
     Dependency для получения database session
@@ -63,9 +282,97 @@ def get_db():
         db.close()
 
 
+async def get_async_db():
+    """
+    Dependency для получения асинхронной database session
+
+    Запросы не блокируют event loop, пока ждут ответа БД.
+    """
+    async with get_async_sessionmaker()() as db:
+        yield db
+
+
+# Время (monotonic), до которого реплика считается недоступной
+_replica_down_until = 0.0
+
+
+def replica_available() -> bool:
+    """Реплика настроена и не помечена недоступной"""
+    return DATABASE_REPLICA_URL is not None and time.monotonic() >= _replica_down_until
+
+
+def _mark_replica_down(error: Exception) -> None:
+    global _replica_down_until
+    _replica_down_until = time.monotonic() + REPLICA_RETRY_SECONDS
+    logger.warning(
+        f"Read replica unavailable, using primary for {REPLICA_RETRY_SECONDS}s: {str(error)}"
+    )
+
+
+def open_read_session() -> Session:
+    """
+    Сессия для запросов только на чтение
+
+    Реплика, если она настроена и доступна, иначе основная БД.
+    Закрывает вызывающий код.
+    """
+    if replica_available():
+        db = ReplicaSessionLocal()
+        try:
+            db.connection()
+            return db
+        except (DBAPIError, OSError) as e:
+            db.close()
+            _mark_replica_down(e)
+    return SessionLocal()
+
+
+async def open_async_read_session() -> AsyncSession:
+    """
+    Асинхронная сессия для запросов только на чтение
+
+    Реплика с откатом на основную БД, как open_read_session.
+    Закрывает вызывающий код.
+    """
+    if replica_available():
+        db = get_async_replica_sessionmaker()()
+        try:
+            await db.connection()
+            return db
+        except (DBAPIError, OSError) as e:
+            await db.close()
+            _mark_replica_down(e)
+    return get_async_sessionmaker()()
+
+
+def create_tables():
+    """
+    Создание и обновление схемы (таблицы, секции records, SCHEMA_UPDATES)
+
+    Без создания пользователей - используется init_db и бенчмарком.
+    """
+    ensure_extensions()
+    from utils.partitions import partitioning_enabled, create_partitioned_records_table
+    # Сводка по периодам заполняется по существующим записям один раз - при создании таблицы
+    new_period_stats = not inspect(engine).has_table("period_stats")
+    if partitioning_enabled(engine):
+        # Секционированная records ссылается на files: сначала остальные таблицы
+        Base.metadata.create_all(
+            bind=engine,
+            tables=[table for table in Base.metadata.sorted_tables if table.name != "records"]
+        )
+        create_partitioned_records_table(engine)
+    Base.metadata.create_all(bind=engine)
+    apply_schema_updates()
+    if new_period_stats:
+        from utils.period_stats import backfill_period_stats
+        with engine.begin() as conn:
+            backfill_period_stats(conn)
+
+
 def init_db():
     """
-    Инициализация базы данных (создание таблиц)
+    Инициализация базы данных (создание таблиц и администратора)
     """
     from passlib.context import CryptContext
 
@@ -80,7 +387,7 @@ def init_db():
         
         # Создание таблиц
         print("Creating database tables...")
-        Base.metadata.create_all(bind=engine)
+        create_tables()
         print("✓ Database tables created/verified")
         
         # Создание админа только если его нет
@@ -2,28 +2,56 @@
 VendHub Database - FastAPI Backend
 Основной файл приложения
 """
-from fastapi import FastAPI, Depends, HTTPException, status, UploadFile, File as FastAPIFile, Query
+from fastapi import FastAPI, Depends, HTTPException, status, UploadFile, File as FastAPIFile, Query, Request, Header
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.security import OAuth2PasswordRequestForm
-from fastapi.responses import StreamingResponse
+from fastapi.responses import StreamingResponse, JSONResponse, Response
+from fastapi.encoders import jsonable_encoder
+from fastapi.concurrency import run_in_threadpool
+from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.orm import Session
-from sqlalchemy import func, or_, text
+from sqlalchemy import func, text, cast, Text, select
 from typing import List, Optional
-from datetime import datetime, timedelta, date
+from datetime import datetime, date
 from pydantic import BaseModel
 from loguru import logger
 import os
-import io
+import itertools
+import secrets
 
-from database import get_db, init_db
-from models import User, File, Record
+from database import (
+    get_db, get_async_db, get_async_sessionmaker, open_async_read_session, open_read_session,
+    replica_available, init_db, dispose_async_engine, engine, DATABASE_REPLICA_URL
+)
+from models import User, File, Record, IngestionJob, PeriodStat
 from auth import (
     authenticate_user, create_user, create_access_token,
-    get_current_user, UserCreate, UserResponse, Token
+    get_current_user, invalidate_cached_user, get_password_metrics,
+    UserCreate, UserResponse, Token
+)
+from utils.excel_parser import list_excel_sheets
+from utils.jobs import (
+    create_job, queue_ingestion, submit_deletion_job, find_active_job, shutdown_executor,
+    fail_stale_jobs, start_job_heartbeat
+)
+from utils.file_deletion import delete_file_data, FILE_DELETE_BACKGROUND_ROWS
+from utils.cache import cached_response_async, invalidate_user, recently_invalidated
+from utils.export import (
+    iter_csv_export, iter_xlsx_export,
+    EXPORT_BATCH_SIZE, CSV_MEDIA_TYPE, XLSX_MEDIA_TYPE
 )
-from utils.excel_parser import (
-    parse_excel_file, extract_date_from_row,
-    get_period_from_date, validate_excel_structure
+from utils.pagination import encode_cursor, decode_cursor, records_after
+from utils.pool_metrics import pool_metrics_snapshot
+from utils.typed_storage import record_data
+from utils.aggregation import (
+    RECORD_FIELDS, column_expression, numeric_expression, aggregate_expression, format_value
+)
+from utils.partitions import list_period_partitions, drop_period_partition
+from utils.period_stats import get_period_counts, NO_PERIOD
+from utils.search_backfill import start_search_text_backfill
+from utils.uploads import (
+    spool_upload_to_disk, retain_temp_file, release_temp_file, check_upload_extension,
+    upload_too_large, MAX_UPLOAD_SIZE, MAX_BATCH_FILES
 )
 
 # Инициализация приложения
@@ -50,6 +78,30 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+
+
+@app.middleware("http")
+async def limit_upload_size(request: Request, call_next):
+    """Отклонение слишком больших загрузок до разбора тела запроса"""
+    if request.method == "POST" and request.url.path.startswith("/api/files/upload"):
+        # Пакетная загрузка: размер каждого файла проверяется при сохранении на диск
+        max_size = MAX_UPLOAD_SIZE
+        if request.url.path.startswith("/api/files/upload/batch"):
+            max_size = MAX_UPLOAD_SIZE * MAX_BATCH_FILES
+
+        content_length = request.headers.get("content-length")
+        if content_length and content_length.isdigit() and int(content_length) > max_size:
+            error = upload_too_large()
+            return JSONResponse(status_code=error.status_code, content={"detail": error.detail})
+    return await call_next(request)
+
+
+# Сколько первых страниц /api/records кешировать
+CACHE_RECORDS_MAX_PAGE = int(os.getenv("CACHE_RECORDS_MAX_PAGE", "3"))
+
+# Секрет endpoint'ов /api/admin/partitions (без него endpoint'ы отключены)
+ADMIN_SECRET = os.getenv("ADMIN_SECRET")
+
 # Логирование
 log_dir = "logs"
 os.makedirs(log_dir, exist_ok=True)
@@ -68,6 +120,28 @@ class FileResponse(BaseModel):
     row_count: int
     uploaded_at: datetime
     headers: Optional[List[str]]
+    column_types: Optional[dict] = None
+    sheet_name: Optional[str] = None
+
+    class Config:
+        from_attributes = True
+
+
+class JobResponse(BaseModel):
+    id: int
+    filename: str
+    kind: str = "ingest"
+    status: str
+    file_id: Optional[int]
+    rows_parsed: int
+    records_added: int
+    rows_per_second: Optional[float]
+    sheet_name: Optional[str] = None
+    stats: Optional[dict]
+    error: Optional[str]
+    created_at: datetime
+    started_at: Optional[datetime]
+    finished_at: Optional[datetime]
 
     class Config:
         from_attributes = True
@@ -118,6 +192,9 @@ async def startup_event():
     
     try:
         init_db()
+        fail_stale_jobs()
+        start_job_heartbeat()
+        start_search_text_backfill(engine)
         logger.info("Database initialized successfully")
     except Exception as e:
         logger.error(f"Database initialization failed: {str(e)}")
@@ -133,6 +210,8 @@ async def startup_event():
 async def shutdown_event():
     """Очистка при выключении"""
     logger.info("Shutting down VendHub Database API...")
+    shutdown_executor()
+    await dispose_async_engine()
 
 
 # ========================================
@@ -143,7 +222,7 @@ async def shutdown_event():
 async def register(user_data: UserCreate, db: Session = Depends(get_db)):
     """Регистрация нового пользователя"""
     try:
-        user = create_user(db, user_data)
+        user = await create_user(db, user_data)
         logger.info(f"New user registered: {user.username}")
         return user
     except HTTPException as e:
@@ -159,7 +238,7 @@ async def login(
     db: Session = Depends(get_db)
 ):
     """Вход пользователя"""
-    user = authenticate_user(db, form_data.username, form_data.password)
+    user = await authenticate_user(db, form_data.username, form_data.password)
     if not user:
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
@@ -183,106 +262,118 @@ async def get_me(current_user: User = Depends(get_current_user)):
 # Файлы
 # ========================================
 
-@app.post("/api/files/upload", response_model=FileResponse, status_code=status.HTTP_201_CREATED)
+@app.post("/api/files/upload", response_model=JobResponse, status_code=status.HTTP_202_ACCEPTED)
 async def upload_file(
     file: UploadFile = FastAPIFile(...),
     current_user: User = Depends(get_current_user),
     db: Session = Depends(get_db)
 ):
-    """Загрузка Excel файла"""
+    """Загрузка Excel или CSV файла (обработка в фоновой задаче)"""
 
     # Проверка типа файла
-    if not file.filename.endswith(('.xlsx', '.xls')):
-        raise HTTPException(
-            status_code=status.HTTP_400_BAD_REQUEST,
-            detail="Only Excel files (.xlsx, .xls) are allowed"
-        )
+    check_upload_extension(file.filename)
+
+    # Сохранение на диск блоками (файл не читается в память целиком)
+    file_path, content_hash = await spool_upload_to_disk(file)
+    retain_temp_file(file_path)
 
     try:
-        # Чтение файла
-        file_content = await file.read()
+        # Повторная загрузка того же файла не парсится, тот же файл в обработке - его задача
+        job = queue_ingestion(db, current_user.id, file.filename, file_path, content_hash)
+    except Exception as e:
+        logger.error(f"File upload error: {str(e)}")
+        db.rollback()
+        raise HTTPException(status_code=500, detail="File processing failed")
+    finally:
+        release_temp_file(file_path)
 
-        # Парсинг
-        headers, rows = parse_excel_file(file_content)
+    logger.info(f"File queued: {file.filename}, job {job.id} by user {current_user.username}")
 
-        if len(rows) == 0:
-            raise HTTPException(
-                status_code=status.HTTP_400_BAD_REQUEST,
-                detail="File contains no data rows"
-            )
+    return job
 
-        # Создание записи файла
-        db_file = File(
-            user_id=current_user.id,
-            filename=file.filename,
-            row_count=len(rows),
-            headers=headers
-        )
-        db.add(db_file)
-        db.flush()  # Получаем ID файла
-
-        # Обработка строк
-        records_added = 0
-        for row in rows:
-            # Извлекаем дату
-            date_obj = extract_date_from_row(row)
-            period = get_period_from_date(date_obj) if date_obj else None
-
-            # Создаем словарь данных
-            row_data = {headers[i]: row[i] for i in range(min(len(headers), len(row)))}
-
-            # Проверяем уникальность (file_id + data)
-            existing = db.query(Record).filter(
-                Record.file_id == db_file.id,
-                Record.data == row_data
-            ).first()
-
-            if not existing:
-                record = Record(
-                    file_id=db_file.id,
-                    data=row_data,
-                    date_field=date_obj,
-                    period=period
-                )
-                db.add(record)
-                records_added += 1
 
-        db.commit()
-        db.refresh(db_file)
+@app.post("/api/files/upload/batch", response_model=List[JobResponse], status_code=status.HTTP_202_ACCEPTED)
+async def upload_files_batch(
+    files: List[UploadFile] = FastAPIFile(...),
+    all_sheets: bool = True,
+    current_user: User = Depends(get_current_user),
+    db: Session = Depends(get_db)
+):
+    """
+    Пакетная загрузка Excel и CSV файлов
+
+    Каждый файл (при all_sheets - каждый видимый лист книги) становится
+    отдельной задачей: задачи обрабатываются параллельно пулом воркеров,
+    каждый лист сохраняется отдельным файлом со своими записями.
+    """
+    if len(files) > MAX_BATCH_FILES:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=f"Too many files (max {MAX_BATCH_FILES})"
+        )
 
-        logger.info(f"File uploaded: {file.filename}, {records_added} records added by user {current_user.username}")
-
-        return db_file
-
-    except ValueError as e:
-        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=str(e))
-    except Exception as e:
-        logger.error(f"File upload error: {str(e)}")
-        db.rollback()
-        raise HTTPException(status_code=500, detail="File processing failed")
+    for file in files:
+        check_upload_extension(file.filename)
+
+    jobs = []
+    for file in files:
+        file_path, content_hash = await spool_upload_to_disk(file)
+        retain_temp_file(file_path)
+
+        try:
+            sheets = []
+            if all_sheets:
+                try:
+                    sheets = await run_in_threadpool(list_excel_sheets, file_path)
+                except ValueError as e:
+                    # Книга не читается: загружается целиком, ошибку покажет задача
+                    logger.warning(f"Sheet listing failed for {file.filename}: {str(e)}")
+
+            if len(sheets) > 1:
+                for sheet in sheets:
+                    jobs.append(queue_ingestion(
+                        db, current_user.id, file.filename, file_path, content_hash, sheet=sheet
+                    ))
+            else:
+                jobs.append(queue_ingestion(db, current_user.id, file.filename, file_path, content_hash))
+        except Exception as e:
+            logger.error(f"Batch upload error ({file.filename}): {str(e)}")
+            db.rollback()
+            raise HTTPException(status_code=500, detail="File processing failed")
+        finally:
+            release_temp_file(file_path)
+
+    logger.info(f"Batch queued: {len(files)} files, {len(jobs)} jobs by user {current_user.username}")
+
+    return jobs
 
 
 @app.get("/api/files", response_model=List[FileResponse])
 async def get_files(
     current_user: User = Depends(get_current_user),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_async_db)
 ):
     """Получить список файлов пользователя"""
-    files = db.query(File).filter(File.user_id == current_user.id).order_by(File.uploaded_at.desc()).all()
-    return files
+    async def load():
+        files = await db.scalars(
+            select(File).where(File.user_id == current_user.id).order_by(File.uploaded_at.desc())
+        )
+        return [FileResponse.model_validate(f) for f in files]
+
+    return await cached_response_async(current_user.id, "files", {}, load)
 
 
 @app.get("/api/files/{file_id}", response_model=FileResponse)
 async def get_file(
     file_id: int,
     current_user: User = Depends(get_current_user),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_async_db)
 ):
     """Получить информацию о файле"""
-    file = db.query(File).filter(
+    file = await db.scalar(select(File).where(
         File.id == file_id,
         File.user_id == current_user.id
-    ).first()
+    ))
 
     if not file:
         raise HTTPException(status_code=404, detail="File not found")
@@ -290,13 +381,17 @@ async def get_file(
     return file
 
 
-@app.delete("/api/files/{file_id}", status_code=status.HTTP_204_NO_CONTENT)
+@app.delete(
+    "/api/files/{file_id}",
+    status_code=status.HTTP_204_NO_CONTENT,
+    responses={202: {"model": JobResponse, "description": "Большой файл удаляется в фоновой задаче"}}
+)
 async def delete_file(
     file_id: int,
     current_user: User = Depends(get_current_user),
     db: Session = Depends(get_db)
 ):
-    """Удалить файл и его данные"""
+    """Удалить файл и его данные (пакетными DELETE, большие файлы - в фоне)"""
     file = db.query(File).filter(
         File.id == file_id,
         File.user_id == current_user.id
@@ -305,182 +400,368 @@ async def delete_file(
     if not file:
         raise HTTPException(status_code=404, detail="File not found")
 
-    db.delete(file)
-    db.commit()
+    if (file.row_count or 0) > FILE_DELETE_BACKGROUND_ROWS:
+        # Удаление уже идет (задача, которая больше не выполняется, переводится в failed)
+        job = find_active_job(
+            db,
+            IngestionJob.kind == "delete",
+            IngestionJob.file_id == file.id
+        )
+
+        if not job:
+            # Повторная загрузка того же файла не должна ссылаться на удаляемый
+            content_hash = file.content_hash
+            file.content_hash = None
+            job = create_job(db, current_user.id, file.filename, kind="delete", file_id=file.id)
+            try:
+                submit_deletion_job(job.id, file.id, current_user.id)
+            except Exception:
+                # Удаление не началось - файл снова доступен для проверки повторов
+                file.content_hash = content_hash
+                db.commit()
+                raise
+            logger.info(f"File deletion queued: {file.filename}, job {job.id} by user {current_user.username}")
+
+        return JSONResponse(
+            status_code=status.HTTP_202_ACCEPTED,
+            content=jsonable_encoder(JobResponse.model_validate(job))
+        )
 
-    logger.info(f"File deleted: {file.filename} by user {current_user.username}")
-    return None
+    filename = file.filename
+    deleted = delete_file_data(db, file.id, current_user.id)
+    invalidate_user(current_user.id)
+
+    logger.info(f"File deleted: {filename} ({deleted} records) by user {current_user.username}")
+    return Response(status_code=status.HTTP_204_NO_CONTENT)
 
 
 # ========================================
-# Записи (база данных)
+# Фоновые задачи загрузки
 # ========================================
 
-@app.get("/api/records", response_model=dict)
-async def get_records(
-    search: Optional[str] = Query(None, description="Поиск по всем полям"),
-    period: Optional[str] = Query(None, description="Фильтр по периоду (YYYY-MM)"),
-    date_from: Optional[date] = Query(None, description="Дата с"),
-    date_to: Optional[date] = Query(None, description="Дата по"),
-    page: int = Query(1, ge=1, description="Номер страницы"),
-    size: int = Query(50, ge=1, le=500, description="Размер страницы"),
+@app.get("/api/jobs", response_model=List[JobResponse])
+async def get_jobs(
+    limit: int = Query(50, ge=1, le=500, description="Количество задач"),
     current_user: User = Depends(get_current_user),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_async_db)
 ):
-    """Получить записи с фильтрацией и пагинацией"""
+    """Получить последние задачи загрузки пользователя"""
+    jobs = await db.scalars(select(IngestionJob).where(
+        IngestionJob.user_id == current_user.id
+    ).order_by(IngestionJob.created_at.desc()).limit(limit))
+    return jobs.all()
+
+
+@app.get("/api/jobs/{job_id}", response_model=JobResponse)
+async def get_job(
+    job_id: int,
+    current_user: User = Depends(get_current_user),
+    db: AsyncSession = Depends(get_async_db)
+):
+    """Получить статус и прогресс задачи загрузки"""
+    job = await db.scalar(select(IngestionJob).where(
+        IngestionJob.id == job_id,
+        IngestionJob.user_id == current_user.id
+    ))
+
+    if not job:
+        raise HTTPException(status_code=404, detail="Job not found")
 
-    # Базовый запрос
-    query = db.query(Record).join(File).filter(File.user_id == current_user.id)
+    return job
 
-    # Фильтрация
+
+# ========================================
+# Записи (база данных)
+# ========================================
+
+async def get_user_read_db(current_user: User = Depends(get_current_user)):
+    """
+    Dependency: асинхронная session для кешируемых endpoint'ов чтения
+
+    Реплика, но сразу после сброса кеша пользователя - основная БД:
+    ответ отстающей реплики попал бы в кеш под новой версией данных.
+    """
+    if recently_invalidated(current_user.id):
+        db = get_async_sessionmaker()()
+    else:
+        db = await open_async_read_session()
+
+    try:
+        yield db
+    finally:
+        await db.close()
+
+
+def filter_records(query, search: Optional[str], period: Optional[str],
+                   date_from: Optional[date], date_to: Optional[date]):
+    """Общие фильтры записей (get_records, export_records; Query или select())"""
     if search:
-        # Поиск по JSONB данным
-        query = query.filter(Record.data.astext.ilike(f"%{search}%"))
+        # Поиск по search_text (триграммный индекс idx_records_search_trgm)
+        term = search.lower().replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_")
+        query = query.filter(Record.search_text.ilike(f"%{term}%", escape="\\"))
 
     if period:
         query = query.filter(Record.period == period)
 
+    # Условие на period, выведенное из диапазона дат, отсекает лишние секции records
     if date_from:
-        query = query.filter(Record.date_field >= date_from)
+        query = query.filter(Record.date_field >= date_from, Record.period >= date_from.strftime("%Y-%m"))
 
     if date_to:
-        query = query.filter(Record.date_field <= date_to)
+        query = query.filter(Record.date_field <= date_to, Record.period <= date_to.strftime("%Y-%m"))
 
-    # Подсчет всего
-    total = query.count()
+    return query
 
-    # Пагинация
-    offset = (page - 1) * size
-    records = query.order_by(Record.date_field.desc().nullslast()).offset(offset).limit(size).all()
 
-    # Формирование ответа
-    return {
-        "total": total,
-        "page": page,
-        "size": size,
-        "pages": (total + size - 1) // size,
-        "data": [
-            {
-                "id": r.id,
-                "file_id": r.file_id,
-                "data": r.data,
-                "date_field": r.date_field,
-                "period": r.period
-            }
-            for r in records
-        ]
-    }
+@app.get("/api/records", response_model=dict)
+async def get_records(
+    search: Optional[str] = Query(None, description="Поиск по всем полям"),
+    period: Optional[str] = Query(None, description="Фильтр по периоду (YYYY-MM)"),
+    date_from: Optional[date] = Query(None, description="Дата с"),
+    date_to: Optional[date] = Query(None, description="Дата по"),
+    page: int = Query(1, ge=1, description="Номер страницы"),
+    size: int = Query(50, ge=1, le=500, description="Размер страницы"),
+    cursor: Optional[str] = Query(None, description="Курсор следующей страницы (next_cursor), вместо page"),
+    skip_total: bool = Query(False, description="Не считать общее количество записей"),
+    current_user: User = Depends(get_current_user),
+    db: AsyncSession = Depends(get_user_read_db)
+):
+    """Получить записи с фильтрацией и пагинацией (по номеру страницы или курсору)"""
+    async def load():
+        # Базовый запрос
+        query = select(Record, File.headers).join(File).where(File.user_id == current_user.id)
+
+        # Фильтрация
+        query = filter_records(query, search, period, date_from, date_to)
+
+        # Подсчет всего
+        total = None
+        if not skip_total:
+            total = await db.scalar(select(func.count()).select_from(query.subquery()))
+
+        # Пагинация: keyset по (date_field, id) или offset по номеру страницы
+        # (лишняя запись - признак следующей страницы)
+        query = query.order_by(Record.date_field.desc().nullslast(), Record.id.desc())
+        if cursor:
+            rows = []
+            for condition in records_after(*decode_cursor(cursor)):
+                rows += (await db.execute(query.where(condition).limit(size + 1 - len(rows)))).all()
+                if len(rows) > size:
+                    break
+        else:
+            rows = (await db.execute(query.offset((page - 1) * size).limit(size + 1))).all()
+
+        has_next = len(rows) > size
+        rows = rows[:size]
+
+        next_cursor = None
+        if has_next:
+            last = rows[-1].Record
+            next_cursor = encode_cursor(last.date_field, last.id)
+
+        # Формирование ответа
+        return {
+            "total": total,
+            "page": None if cursor else page,
+            "size": size,
+            "pages": (total + size - 1) // size if total is not None else None,
+            "next_cursor": next_cursor,
+            "data": [
+                {
+                    "id": r.id,
+                    "file_id": r.file_id,
+                    "data": record_data(r.data, r.cells, headers),
+                    "date_field": r.date_field,
+                    "period": r.period
+                }
+                for r, headers in rows
+            ]
+        }
+
+    # Первые страницы без курсора кешируются до загрузки/удаления файлов
+    if cursor is None and page <= CACHE_RECORDS_MAX_PAGE:
+        params = {
+            "search": search, "period": period, "date_from": date_from,
+            "date_to": date_to, "page": page, "size": size, "skip_total": skip_total
+        }
+        return await cached_response_async(current_user.id, "records", params, load)
+
+    return await load()
 
 
 @app.get("/api/records/stats", response_model=DatabaseStats)
 async def get_database_stats(
     current_user: User = Depends(get_current_user),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_user_read_db)
 ):
     """Получить статистику базы данных"""
+    async def load():
+        # Статистика файлов
+        total_files = await db.scalar(select(func.count(File.id)).where(File.user_id == current_user.id))
+
+        # Количество записей по периодам (сводка period_stats, общий sync-код)
+        period_counts = await db.run_sync(get_period_counts, current_user.id)
+        total_records = sum(count for _, count in period_counts)
+
+        # Уникальные записи (по row_hash; для старых записей без хеша - по тексту data,
+        # без md5: функции нет в SQLite)
+        row_key = func.coalesce(Record.row_hash, cast(Record.data, Text))
+        unique_records = await db.scalar(
+            select(func.count(func.distinct(row_key))).select_from(Record).join(File).where(
+                File.user_id == current_user.id
+            )
+        )
 
-    # Статистика файлов
-    total_files = db.query(func.count(File.id)).filter(File.user_id == current_user.id).scalar()
-
-    # Статистика записей
-    total_records = db.query(func.count(Record.id)).join(File).filter(File.user_id == current_user.id).scalar()
+        # Форматирование периодов
+        month_names = ['Январь', 'Февраль', 'Март', 'Апрель', 'Май', 'Июнь',
+                       'Июль', 'Август', 'Сентябрь', 'Октябрь', 'Ноябрь', 'Декабрь']
+
+        periods = []
+        for period, count in period_counts:
+            if period == NO_PERIOD:
+                continue
+            year, month = period.split('-')
+            label = f"{month_names[int(month) - 1]} {year}"
+            periods.append(PeriodStats(period=period, count=count, label=label))
+
+        return DatabaseStats(
+            total_files=total_files or 0,
+            total_records=total_records or 0,
+            unique_records=unique_records or 0,
+            periods=periods
+        )
 
-    # Уникальные записи (по data)
-    unique_records = db.query(func.count(func.distinct(Record.data))).join(File).filter(
-        File.user_id == current_user.id
-    ).scalar()
-
-    # Статистика по периодам
-    period_stats = db.query(
-        Record.period,
-        func.count(Record.id).label('count')
-    ).join(File).filter(
-        File.user_id == current_user.id,
-        Record.period.isnot(None)
-    ).group_by(Record.period).order_by(Record.period.desc()).all()
-
-    # Форматирование периодов
-    month_names = ['Январь', 'Февраль', 'Март', 'Апрель', 'Май', 'Июнь',
-                   'Июль', 'Август', 'Сентябрь', 'Октябрь', 'Ноябрь', 'Декабрь']
-
-    periods = []
-    for period, count in period_stats:
-        year, month = period.split('-')
-        label = f"{month_names[int(month) - 1]} {year}"
-        periods.append(PeriodStats(period=period, count=count, label=label))
-
-    return DatabaseStats(
-        total_files=total_files or 0,
-        total_records=total_records or 0,
-        unique_records=unique_records or 0,
-        periods=periods
-    )
+    return await cached_response_async(current_user.id, "stats", {}, load)
 
 
-@app.get("/api/records/export")
-async def export_records(
+@app.get("/api/records/aggregate")
+async def aggregate_records(
+    func_name: str = Query(..., alias="func", pattern="^(sum|avg|min|max|count)$", description="Агрегатная функция"),
+    column: Optional[str] = Query(None, description="Колонка значений (для count можно не указывать)"),
+    group_by: List[str] = Query([], description="Колонки группировки (или period, date, file_id)"),
     search: Optional[str] = Query(None),
     period: Optional[str] = Query(None),
     date_from: Optional[date] = Query(None),
     date_to: Optional[date] = Query(None),
+    limit: int = Query(1000, ge=1, le=10000, description="Максимум групп"),
     current_user: User = Depends(get_current_user),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_user_read_db)
 ):
-    """Экспорт записей в Excel"""
-    import openpyxl
-    from openpyxl.styles import Font, PatternFill
+    """Агрегация по колонке записей (sum/avg/min/max/count) с группировкой, считается в БД"""
+    if column is None and func_name != "count":
+        raise HTTPException(status_code=400, detail="Column is required for this function")
+    if len(group_by) > 3:
+        raise HTTPException(status_code=400, detail="At most 3 group_by columns are allowed")
+
+    async def load():
+        # Заголовки файлов: позиция колонки в cells у каждого файла своя
+        files = (await db.execute(
+            select(File.id, File.headers, File.column_types.isnot(None)).where(File.user_id == current_user.id)
+        )).all()
+
+        def resolve(name: str):
+            expression = column_expression(name, files)
+            if expression is None:
+                raise HTTPException(status_code=400, detail=f"Unknown column: {name}")
+            return expression
+
+        value = None
+        if column is not None:
+            value = resolve(column)
+            if func_name != "count":
+                value = numeric_expression(value, db.bind.dialect.name)
+
+        groups = [
+            (RECORD_FIELDS[name] if name in RECORD_FIELDS else resolve(name)).label(f"g{i}")
+            for i, name in enumerate(group_by)
+        ]
+        aggregate = aggregate_expression(func_name, value).label("value")
+        counted = (func.count(value) if value is not None else func.count(Record.id)).label("count")
 
-    # Получаем данные с фильтрами (без пагинации)
-    query = db.query(Record).join(File).filter(File.user_id == current_user.id)
+        query = select(*groups, aggregate, counted).select_from(Record).join(File).where(
+            File.user_id == current_user.id
+        )
+        query = filter_records(query, search, period, date_from, date_to)
+        if groups:
+            query = query.group_by(*groups).order_by(aggregate.desc().nullslast())
+        rows = (await db.execute(query.limit(limit))).all()
 
-    if search:
-        query = query.filter(Record.data.astext.ilike(f"%{search}%"))
-    if period:
-        query = query.filter(Record.period == period)
-    if date_from:
-        query = query.filter(Record.date_field >= date_from)
-    if date_to:
-        query = query.filter(Record.date_field <= date_to)
+        return {
+            "func": func_name,
+            "column": column,
+            "group_by": group_by,
+            "groups": [
+                {
+                    "key": {name: row[i] for i, name in enumerate(group_by)},
+                    "value": format_value(row.value),
+                    "count": row.count
+                }
+                for row in rows
+            ]
+        }
 
-    records = query.order_by(Record.date_field.desc().nullslast()).all()
+    params = {
+        "func": func_name, "column": column, "group_by": group_by, "search": search,
+        "period": period, "date_from": date_from, "date_to": date_to, "limit": limit
+    }
+    return await cached_response_async(current_user.id, "aggregate", params, load)
 
-    if not records:
-        raise HTTPException(status_code=404, detail="No data to export")
 
-    # Создаем Excel
-    wb = openpyxl.Workbook()
-    ws = wb.active
-    ws.title = "VendHub Database"
+@app.get("/api/records/export")
+async def export_records(
+    search: Optional[str] = Query(None),
+    period: Optional[str] = Query(None),
+    date_from: Optional[date] = Query(None),
+    date_to: Optional[date] = Query(None),
+    format: str = Query("xlsx", pattern="^(xlsx|csv)$", description="Формат: xlsx или csv"),
+    current_user: User = Depends(get_current_user)
+):
+    """Потоковый экспорт записей в Excel или CSV"""
 
-    # Заголовки (из первой записи)
-    headers = list(records[0].data.keys())
-    ws.append(['#'] + headers)
+    # Сессия живет, пока отдается ответ (get_db закрывается раньше); чтение - с реплики
+    db = open_read_session()
+    try:
+        # Получаем данные с фильтрами (без пагинации), чтение server-side курсором
+        query = db.query(Record.data, Record.cells, File.headers).join(File).filter(File.user_id == current_user.id)
+        query = filter_records(query, search, period, date_from, date_to)
+        query = query.order_by(Record.date_field.desc().nullslast(), Record.id.desc())
+
+        rows = (record_data(data, cells, headers) for data, cells, headers in query.yield_per(EXPORT_BATCH_SIZE))
+        first = next(rows, None)
+    except Exception:
+        db.close()
+        raise
 
-    # Стиль заголовков
-    header_fill = PatternFill(start_color="667eea", end_color="667eea", fill_type="solid")
-    header_font = Font(bold=True, color="FFFFFF")
+    if first is None:
+        db.close()
+        raise HTTPException(status_code=404, detail="No data to export")
 
-    for cell in ws[1]:
-        cell.fill = header_fill
-        cell.font = header_font
+    # Заголовки (из первой записи)
+    headers = list(first.keys())
 
-    # Данные
-    for i, record in enumerate(records, 1):
-        row_data = [i] + [record.data.get(h, '') for h in headers]
-        ws.append(row_data)
+    def stream():
+        exported = 0
 
-    # Сохранение в буфер
-    output = io.BytesIO()
-    wb.save(output)
-    output.seek(0)
+        def counted():
+            nonlocal exported
+            for data in itertools.chain([first], rows):
+                exported += 1
+                yield data
 
-    filename = f"VendHub_Export_{datetime.now().strftime('%Y-%m-%d_%H-%M-%S')}.xlsx"
+        try:
+            if format == "csv":
+                yield from iter_csv_export(headers, counted())
+            else:
+                yield from iter_xlsx_export(headers, counted())
+            logger.info(f"Exported {exported} records for user {current_user.username}")
+        finally:
+            db.close()
 
-    logger.info(f"Exported {len(records)} records for user {current_user.username}")
+    filename = f"VendHub_Export_{datetime.now().strftime('%Y-%m-%d_%H-%M-%S')}.{format}"
 
     return StreamingResponse(
-        output,
-        media_type="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet",
+        stream(),
+        media_type=CSV_MEDIA_TYPE if format == "csv" else XLSX_MEDIA_TYPE,
         headers={"Content-Disposition": f"attachment; filename={filename}"}
     )
 
@@ -508,6 +789,7 @@ async def health_check_db(db: Session = Depends(get_db)):
         return {
             "status": "healthy",
             "database": "connected",
+            "replica": ("available" if replica_available() else "unavailable") if DATABASE_REPLICA_URL else "not configured",
             "timestamp": datetime.now().isoformat()
         }
     except Exception as e:
@@ -518,6 +800,34 @@ async def health_check_db(db: Session = Depends(get_db)):
         )
 
 
+@app.get("/health/pool")
+async def health_check_pool():
+    """Метрики пулов соединений с БД (ожидание, overflow, ошибки pre-ping)"""
+    return {
+        "status": "healthy",
+        "pools": pool_metrics_snapshot(),
+        "timestamp": datetime.now().isoformat()
+    }
+
+
+@app.get("/health/auth")
+async def health_check_auth():
+    """Метрики пула хеширования паролей (bcrypt)"""
+    return {
+        "status": "healthy",
+        "password_hashing": get_password_metrics(),
+        "timestamp": datetime.now().isoformat()
+    }
+
+
+def require_admin_secret(x_admin_secret: Optional[str] = Header(None)):
+    """Проверка секрета endpoint'ов секций из заголовка X-Admin-Secret"""
+    if not ADMIN_SECRET:
+        raise HTTPException(status_code=404, detail="Not Found")
+    if not x_admin_secret or not secrets.compare_digest(x_admin_secret, ADMIN_SECRET):
+        raise HTTPException(status_code=403, detail="Invalid secret")
+
+
 @app.get("/api/admin/reset-db")
 async def reset_database(secret: str = Query(...), db: Session = Depends(get_db)):
     """Одноразовая очистка БД и создание админа (удалить после использования)"""
@@ -530,8 +840,10 @@ async def reset_database(secret: str = Query(...), db: Session = Depends(get_db)
         # Удаляем все записи, файлы и пользователей
         db.query(Record).delete()
         db.query(File).delete()
+        db.query(PeriodStat).delete()
         db.query(User).delete()
         db.commit()
+        invalidate_cached_user()
 
         # Создаем админа
         password = "311941990"
@@ -552,6 +864,29 @@ async def reset_database(secret: str = Query(...), db: Session = Depends(get_db)
         raise HTTPException(status_code=500, detail=str(e))
 
 
+@app.get("/api/admin/partitions", dependencies=[Depends(require_admin_secret)])
+async def get_partitions():
+    """Секции таблицы records (RECORDS_PARTITIONING=period)"""
+
+    return {"partitions": list_period_partitions(engine)}
+
+
+@app.delete("/api/admin/partitions/{period}", dependencies=[Depends(require_admin_secret)])
+async def delete_partition(period: str):
+    """Удаление всех записей периода целой секцией"""
+
+    try:
+        user_ids = drop_period_partition(engine, period)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+    for user_id in user_ids:
+        invalidate_user(user_id)
+
+    logger.info(f"Partition for period {period} dropped ({len(user_ids)} users affected)")
+    return {"status": "success", "period": period, "users_affected": len(user_ids)}
+
+
 # Запуск приложения
 if __name__ == "__main__":
     import uvicorn
@@ -1,7 +1,8 @@
 """
 SQLAlchemy модели для VendHub Database
 """
-from sqlalchemy import Column, Integer, String, DateTime, ForeignKey, Text, Date, Index, UniqueConstraint, JSON
+from sqlalchemy import Column, Integer, String, DateTime, ForeignKey, Text, Date, Float, Index, UniqueConstraint, JSON, and_
+from sqlalchemy.dialects.postgresql import JSONB
 from sqlalchemy.orm import relationship
 from sqlalchemy.sql import func
 from database import Base
@@ -19,7 +20,8 @@ class User(Base):
     updated_at = Column(DateTime(timezone=True), onupdate=func.now())
 
     # Relationships
-    files = relationship("File", back_populates="user", cascade="all, delete-orphan")
+    # passive_deletes: дочерние строки удаляет ON DELETE CASCADE в БД, без загрузки в сессию
+    files = relationship("File", back_populates="user", cascade="all, delete-orphan", passive_deletes=True)
 
 
 class File(Base):
@@ -32,15 +34,19 @@ class File(Base):
     file_url = Column(Text, nullable=True)  # S3 URL или путь
     row_count = Column(Integer, default=0)
     headers = Column(JSON, nullable=True)  # Заголовки колонок
+    column_types = Column(JSON(none_as_null=True), nullable=True)  # Типы колонок {заголовок: number/date/text/...} (STORAGE_MODE=typed)
+    content_hash = Column(String(64), nullable=True)  # SHA-256 содержимого файла
+    sheet_name = Column(String(255), nullable=True)  # Лист книги (None - лист по умолчанию или CSV)
     uploaded_at = Column(DateTime(timezone=True), server_default=func.now())
 
     # Relationships
     user = relationship("User", back_populates="files")
-    records = relationship("Record", back_populates="file", cascade="all, delete-orphan")
+    records = relationship("Record", back_populates="file", cascade="all, delete-orphan", passive_deletes=True)
 
     # Индексы
     __table_args__ = (
         Index('idx_files_user_uploaded', 'user_id', 'uploaded_at'),
+        Index('idx_files_user_content_hash', 'user_id', 'content_hash'),
     )
 
 
@@ -50,9 +56,12 @@ class Record(Base):
 
     id = Column(Integer, primary_key=True, index=True)
     file_id = Column(Integer, ForeignKey("files.id", ondelete="CASCADE"), nullable=False, index=True)
-    data = Column(JSON, nullable=False)  # Данные строки в JSON формате
+    data = Column(JSON(none_as_null=True), nullable=True)  # Данные строки в JSON формате (STORAGE_MODE=json)
+    cells = Column(JSON(none_as_null=True).with_variant(JSONB(none_as_null=True), "postgresql"), nullable=True)  # Значения по порядку File.headers (STORAGE_MODE=typed)
     date_field = Column(Date, nullable=True, index=True)  # Извлеченная дата
     period = Column(String(7), nullable=True, index=True)  # YYYY-MM формат
+    row_hash = Column(String(64), nullable=True)  # SHA-256 нормализованной строки (create_unique_key)
+    search_text = Column(Text, nullable=True)  # Значения строки в нижнем регистре (для поиска)
     created_at = Column(DateTime(timezone=True), server_default=func.now())
 
     # Relationships
@@ -62,6 +71,59 @@ class Record(Base):
     __table_args__ = (
         Index('idx_records_date_period', 'date_field', 'period'),
         Index('idx_records_file_date', 'file_id', 'date_field'),
+        # Keyset пагинация: порядок индекса совпадает с ORDER BY date_field DESC NULLS LAST, id DESC
+        # (SQLite не поддерживает NULLS LAST в индексе)
+        Index('idx_records_date_desc_id', date_field.desc().nullslast(), id.desc()).ddl_if(dialect="postgresql"),
+        Index('idx_records_file_hash', 'file_id', 'row_hash'),
+        Index('idx_records_row_hash', 'row_hash'),
+        # Триграммный индекс для поиска ILIKE '%...%' (расширение pg_trgm)
+        Index('idx_records_search_trgm', 'search_text',
+              postgresql_using='gin', postgresql_ops={'search_text': 'gin_trgm_ops'}),
         # Уникальность: один файл + одинаковые данные
         # UniqueConstraint('file_id', 'data', name='unique_file_data'),  # Отключено для SQLite
     )
+
+
+class IngestionJob(Base):
+    """Модель фоновой задачи загрузки файла"""
+    __tablename__ = "ingestion_jobs"
+
+    id = Column(Integer, primary_key=True, index=True)
+    user_id = Column(Integer, ForeignKey("users.id", ondelete="CASCADE"), nullable=False, index=True)
+    file_id = Column(Integer, ForeignKey("files.id", ondelete="SET NULL"), nullable=True)
+    filename = Column(String(255), nullable=False)
+    content_hash = Column(String(64), nullable=True)  # SHA-256 содержимого файла
+    sheet_name = Column(String(255), nullable=True)  # Лист книги (None - лист по умолчанию или CSV)
+    kind = Column(String(20), nullable=False, default="ingest", server_default="ingest")  # ingest/delete
+    status = Column(String(20), nullable=False, default="pending")  # pending/running/completed/failed/duplicate
+    rows_parsed = Column(Integer, default=0)
+    records_added = Column(Integer, default=0)
+    rows_per_second = Column(Float, nullable=True)
+    stats = Column(JSON, nullable=True)  # Статистика по колонкам файла
+    error = Column(Text, nullable=True)
+    created_at = Column(DateTime(timezone=True), server_default=func.now())
+    started_at = Column(DateTime(timezone=True), nullable=True)
+    finished_at = Column(DateTime(timezone=True), nullable=True)
+    owner = Column(String(255), nullable=True)  # Процесс API, поставивший задачу (host:pid)
+    heartbeat_at = Column(DateTime(timezone=True), nullable=True)  # Последняя отметка живой задачи
+
+    # Индексы
+    __table_args__ = (
+        Index('idx_jobs_user_created', 'user_id', 'created_at'),
+        # Один и тот же лист обрабатывается одной задачей (повторные загрузки из разных процессов API)
+        Index(
+            'uq_jobs_active_upload', 'user_id', 'content_hash', func.coalesce(sheet_name, ''),
+            unique=True,
+            postgresql_where=and_(status.in_(("pending", "running")), content_hash.isnot(None)),
+            sqlite_where=and_(status.in_(("pending", "running")), content_hash.isnot(None))
+        ),
+    )
+
+
+class PeriodStat(Base):
+    """Сводка количества записей пользователя по периодам (обновляется при загрузке и удалении)"""
+    __tablename__ = "period_stats"
+
+    user_id = Column(Integer, ForeignKey("users.id", ondelete="CASCADE"), primary_key=True)
+    period = Column(String(7), primary_key=True)  # YYYY-MM; '' - записи без даты
+    record_count = Column(Integer, nullable=False, default=0)
@@ -0,0 +1,107 @@
+"""
+Выражения для агрегации по колонкам записей (Record.data и Record.cells)
+"""
+from collections import defaultdict
+from typing import List, Dict, Any, Optional, Tuple
+
+from sqlalchemy import case, cast, func, and_, Numeric, Float
+
+from models import Record
+
+# Поля записи, по которым можно группировать наравне с колонками файла
+RECORD_FIELDS = {
+    "period": Record.period,
+    "date": Record.date_field,
+    "file_id": Record.file_id,
+}
+
+# Число: необязательный минус, цифры, дробная часть через точку или запятую
+NUMBER_REGEX = r'^\s*-?[0-9]+([.,][0-9]+)?\s*$'
+
+
+def column_expression(column: str, files: List[Tuple[int, Optional[List[str]], bool]]):
+    """
+    Текстовое значение колонки в обоих режимах хранения
+
+    Для STORAGE_MODE=json - data->>'колонка'. Для typed позиция колонки
+    в cells своя у каждого файла, поэтому файлы группируются по позиции
+    и значение выбирается через CASE по file_id.
+
+    Args:
+        column: Заголовок колонки
+        files: Файлы пользователя (id, headers, typed)
+
+    Returns:
+        SQL выражение или None, если колонки нет ни в одном файле
+    """
+    json_found = False
+    typed_positions: Dict[int, List[int]] = defaultdict(list)
+
+    for file_id, headers, typed in files:
+        if not headers or column not in headers:
+            continue
+        if typed:
+            typed_positions[headers.index(column)].append(file_id)
+        else:
+            json_found = True
+
+    expressions = []
+    if json_found:
+        expressions.append(Record.data[column].as_string())
+    if typed_positions:
+        expressions.append(case(
+            *[
+                (Record.file_id.in_(file_ids), Record.cells[position].as_string())
+                for position, file_ids in sorted(typed_positions.items())
+            ],
+            else_=None
+        ))
+
+    if not expressions:
+        return None
+    return expressions[0] if len(expressions) == 1 else func.coalesce(*expressions)
+
+
+def numeric_expression(text_value, dialect_name: str):
+    """
+    Число из текстового значения (нечисловые значения - NULL, а не ошибка приведения)
+
+    Args:
+        text_value: Текстовое SQL выражение
+        dialect_name: Диалект БД (postgresql или sqlite)
+    """
+    normalized = func.replace(func.trim(text_value), ',', '.')
+
+    if dialect_name == "postgresql":
+        return case(
+            (text_value.op('~')(NUMBER_REGEX), cast(normalized, Numeric)),
+            else_=None
+        )
+
+    # SQLite: регулярных выражений нет, проверка через GLOB
+    return case(
+        (
+            and_(
+                normalized.op('GLOB')('*[0-9]*'),
+                normalized.op('NOT GLOB')('*[^0-9.-]*'),
+                normalized.op('NOT GLOB')('?*-*'),
+            ),
+            cast(normalized, Float)
+        ),
+        else_=None
+    )
+
+
+def aggregate_expression(func_name: str, value):
+    """Агрегат по значению колонки (count - непустые значения или все строки)"""
+    if func_name == "count":
+        return func.count(value) if value is not None else func.count(Record.id)
+    return getattr(func, func_name)(value)
+
+
+def format_value(value: Any) -> Any:
+    """Результат агрегации для JSON (Decimal -> int/float)"""
+    if value is None or isinstance(value, (int, float)):
+        return value
+    number = float(value)
+    return int(number) if number.is_integer() else number
@@ -0,0 +1,248 @@
+"""
+Кеш ответов API с инвалидацией по версии данных пользователя
+"""
+import json
+import os
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Awaitable, Callable, Dict, Optional
+
+from fastapi.encoders import jsonable_encoder
+from loguru import logger
+
+# memory:// - кеш в процессе, redis://host:port/db - общий кеш воркеров (нужен пакет redis)
+CACHE_URL = os.getenv("CACHE_URL", "memory://")
+CACHE_TTL = int(os.getenv("CACHE_TTL", "300"))
+CACHE_MAX_ENTRIES = int(os.getenv("CACHE_MAX_ENTRIES", "10000"))
+# Сколько секунд после сброса кеша пользователя читать из основной БД, а не из реплики
+CACHE_REPLICA_LAG = int(os.getenv("CACHE_REPLICA_LAG", "10"))
+
+
+class CacheBackend:
+    """Интерфейс хранилища кеша"""
+
+    def get(self, key: str) -> Optional[Any]:
+        """Значение по ключу или None"""
+        raise NotImplementedError
+
+    def set(self, key: str, value: Any, ttl: int) -> None:
+        """Сохранить значение на ttl секунд"""
+        raise NotImplementedError
+
+    def delete(self, key: str) -> None:
+        """Удалить значение"""
+        raise NotImplementedError
+
+    def counter(self, key: str) -> int:
+        """Текущее значение счетчика (0, если его нет)"""
+        raise NotImplementedError
+
+    def incr(self, key: str) -> int:
+        """Увеличить счетчик (счетчики не вытесняются и не истекают)"""
+        raise NotImplementedError
+
+    def clear(self) -> None:
+        """Очистить кеш"""
+        raise NotImplementedError
+
+
+class MemoryCache(CacheBackend):
+    """Кеш в памяти процесса: TTL и вытеснение давно не использованных (LRU)"""
+
+    def __init__(self, max_entries: int = CACHE_MAX_ENTRIES):
+        self.max_entries = max_entries
+        self._entries: "OrderedDict[str, tuple]" = OrderedDict()
+        self._counters: Dict[str, int] = {}
+        self._lock = threading.Lock()
+
+    def get(self, key: str) -> Optional[Any]:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            expires_at, value = entry
+            if expires_at < time.monotonic():
+                del self._entries[key]
+                return None
+            self._entries.move_to_end(key)
+            return value
+
+    def set(self, key: str, value: Any, ttl: int) -> None:
+        with self._lock:
+            self._entries[key] = (time.monotonic() + ttl, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def delete(self, key: str) -> None:
+        with self._lock:
+            self._entries.pop(key, None)
+
+    def counter(self, key: str) -> int:
+        with self._lock:
+            return self._counters.get(key, 0)
+
+    def incr(self, key: str) -> int:
+        with self._lock:
+            self._counters[key] = self._counters.get(key, 0) + 1
+            return self._counters[key]
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+            self._counters.clear()
+
+
+class RedisCache(CacheBackend):
+    """Кеш в Redis (значения хранятся в JSON, LRU - политикой maxmemory сервера)"""
+
+    def __init__(self, url: str, prefix: str = "vendhub:"):
+        import redis  # Необязательная зависимость
+
+        self._client = redis.Redis.from_url(url)
+        self._prefix = prefix
+
+    def get(self, key: str) -> Optional[Any]:
+        raw = self._client.get(self._prefix + key)
+        return json.loads(raw) if raw is not None else None
+
+    def set(self, key: str, value: Any, ttl: int) -> None:
+        self._client.set(self._prefix + key, json.dumps(value), ex=ttl)
+
+    def delete(self, key: str) -> None:
+        self._client.delete(self._prefix + key)
+
+    def counter(self, key: str) -> int:
+        raw = self._client.get(self._prefix + key)
+        return int(raw) if raw is not None else 0
+
+    def incr(self, key: str) -> int:
+        return int(self._client.incr(self._prefix + key))
+
+    def clear(self) -> None:
+        keys = list(self._client.scan_iter(self._prefix + "*"))
+        if keys:
+            self._client.delete(*keys)
+
+
+def create_cache_backend(url: str) -> CacheBackend:
+    """Создание хранилища по CACHE_URL"""
+    if url.startswith("redis://") or url.startswith("rediss://"):
+        return RedisCache(url)
+    return MemoryCache()
+
+
+_backend: Optional[CacheBackend] = None
+
+
+def get_cache() -> CacheBackend:
+    """Текущее хранилище кеша (создается при первом обращении)"""
+    global _backend
+    if _backend is None:
+        _backend = create_cache_backend(CACHE_URL)
+    return _backend
+
+
+def set_cache_backend(backend: CacheBackend) -> None:
+    """Подключить свое хранилище кеша"""
+    global _backend
+    _backend = backend
+
+
+def _version_key(user_id: int) -> str:
+    return f"user_version:{user_id}"
+
+
+def _invalidated_key(user_id: int) -> str:
+    return f"user_invalidated:{user_id}"
+
+
+def invalidate_user(user_id: int) -> None:
+    """
+    Сброс кеша пользователя (после загрузки или удаления файла)
+
+    Записи не удаляются: версия данных пользователя входит в ключ,
+    поэтому старые записи просто перестают читаться и истекают по TTL.
+    Метка сброса живет CACHE_REPLICA_LAG секунд (см. recently_invalidated).
+    """
+    try:
+        cache = get_cache()
+        cache.incr(_version_key(user_id))
+        if CACHE_REPLICA_LAG > 0:
+            cache.set(_invalidated_key(user_id), 1, CACHE_REPLICA_LAG)
+    except Exception as e:
+        logger.warning(f"Cache invalidation failed for user {user_id}: {str(e)}")
+
+
+def recently_invalidated(user_id: int) -> bool:
+    """
+    Кеш пользователя сброшен не позже CACHE_REPLICA_LAG секунд назад
+
+    Реплика в это время может еще не содержать изменений, а ее ответ
+    попал бы в кеш под новой версией данных - читать нужно из основной БД.
+    """
+    try:
+        return get_cache().get(_invalidated_key(user_id)) is not None
+    except Exception as e:
+        logger.warning(f"Cache read failed: {str(e)}")
+        # Недоступный кеш ничего не сохранит - реплика безопасна
+        return False
+
+
+def _cache_key(cache: CacheBackend, user_id: int, namespace: str, params: Dict[str, Any]) -> str:
+    version = cache.counter(_version_key(user_id))
+    return f"{namespace}:{user_id}:v{version}:{json.dumps(jsonable_encoder(params), sort_keys=True)}"
+
+
+def _cache_read(user_id: int, namespace: str, params: Dict[str, Any]):
+    """
+    Ключ и значение из кеша
+
+    Returns:
+        Tuple[key, value]; key = None, если кеш недоступен
+    """
+    cache = get_cache()
+    try:
+        key = _cache_key(cache, user_id, namespace, params)
+        return key, cache.get(key)
+    except Exception as e:
+        # Недоступный кеш не должен ломать API
+        logger.warning(f"Cache read failed: {str(e)}")
+        return None, None
+
+
+def _cache_write(key: Optional[str], value: Any, ttl: Optional[int]) -> None:
+    if key is None:
+        return
+    try:
+        get_cache().set(key, value, ttl or CACHE_TTL)
+    except Exception as e:
+        logger.warning(f"Cache write failed: {str(e)}")
+
+
+async def cached_response_async(
+    user_id: int,
+    namespace: str,
+    params: Dict[str, Any],
+    compute: Callable[[], Awaitable[Any]],
+    ttl: Optional[int] = None
+) -> Any:
+    """
+    Ответ из кеша или результат await compute() (сохраняется в кеш)
+
+    Args:
+        user_id: ID пользователя
+        namespace: Имя endpoint'а
+        params: Параметры запроса, влияющие на ответ
+        compute: Асинхронный расчет ответа при промахе
+        ttl: Время жизни в секундах (по умолчанию CACHE_TTL)
+
+    Returns:
+        JSON-совместимый ответ
+    """
+    key, value = _cache_read(user_id, namespace, params)
+    if value is None:
+        value = jsonable_encoder(await compute())
+        _cache_write(key, value, ttl)
+    return value
@@ -0,0 +1,146 @@
+"""
+Потоковое чтение CSV файлов (определение кодировки и разделителя)
+"""
+import codecs
+import csv
+import io
+import os
+import re
+from typing import Any, Callable, Iterator, Tuple, Union, BinaryIO
+
+# Кодировка, если файл не читается как UTF-8 (выгрузки Excel под Windows)
+CSV_FALLBACK_ENCODING = os.getenv("CSV_FALLBACK_ENCODING", "cp1251")
+
+# Объем начала файла для определения кодировки и разделителя
+CSV_SAMPLE_SIZE = 64 * 1024
+
+# Допустимые разделители (в порядке предпочтения)
+CSV_DELIMITERS = ";,\t|"
+
+# Управляющие символы, которых не бывает в тексте (кроме \t, \n, \r, \f)
+_CONTROL_RE = re.compile(r'[\x00-\x08\x0b\x0e-\x1f\x7f]')
+
+# Числа для режима typed: без ведущих нулей (коды вида 007 остаются строками)
+_INT_RE = re.compile(r'^-?(0|[1-9]\d*)$')
+_FLOAT_RE = re.compile(r'^-?(0|[1-9]\d*)\.\d+$')
+
+# Поля CSV могут быть длиннее лимита модуля csv по умолчанию (128 КБ)
+csv.field_size_limit(16 * 1024 * 1024)
+
+
+def detect_encoding(sample: bytes) -> str:
+    """
+    Кодировка CSV по началу файла
+
+    BOM определяет кодировку однозначно; без BOM проверяется UTF-8
+    (обрезанный на границе выборки символ не считается ошибкой),
+    иначе - CSV_FALLBACK_ENCODING.
+    """
+    if sample.startswith(codecs.BOM_UTF8):
+        return "utf-8-sig"
+    if sample.startswith((codecs.BOM_UTF16_LE, codecs.BOM_UTF16_BE)):
+        return "utf-16"
+
+    try:
+        codecs.getincrementaldecoder("utf-8")().decode(sample, final=False)
+        return "utf-8"
+    except UnicodeDecodeError:
+        return CSV_FALLBACK_ENCODING
+
+
+def is_text_sample(sample: bytes, encoding: str) -> bool:
+    """
+    Начало файла - текст в кодировке encoding
+
+    Двоичные файлы (PDF, архивы, случайные байты) не декодируются
+    или содержат много управляющих символов; единичные допускаются.
+    """
+    try:
+        text = codecs.getincrementaldecoder(encoding)().decode(sample, final=False)
+    except UnicodeDecodeError:
+        return False
+    return len(_CONTROL_RE.findall(text)) <= len(text) // 100
+
+
+def detect_delimiter(sample: str) -> str:
+    """
+    Разделитель CSV по началу файла (csv.Sniffer по целым строкам)
+
+    Если Sniffer не справился - самый частый из CSV_DELIMITERS
+    в первой строке, по умолчанию запятая.
+    """
+    # Последняя строка выборки может быть обрезана
+    if "\n" in sample:
+        sample = sample[:sample.rindex("\n")]
+
+    try:
+        return csv.Sniffer().sniff(sample, delimiters=CSV_DELIMITERS).delimiter
+    except csv.Error:
+        first_line = sample.split("\n", 1)[0]
+        counts = [(first_line.count(d), d) for d in CSV_DELIMITERS]
+        count, delimiter = max(counts, key=lambda item: item[0])
+        return delimiter if count else ","
+
+
+def _typed_value(value: str) -> Any:
+    """Значение ячейки для режима typed: пустое - None, целые и дробные числа - числом"""
+    if value == '':
+        return None
+    if _INT_RE.match(value):
+        return int(value)
+    if _FLOAT_RE.match(value):
+        return float(value)
+    return value
+
+
+def open_csv_rows(
+    source: Union[bytes, str, BinaryIO],
+    typed: bool = False
+) -> Tuple[Iterator[Tuple[Any, ...]], Callable[[], None]]:
+    """
+    Строки CSV файла без загрузки файла в память
+
+    Args:
+        source: Байты файла, путь к файлу или бинарный file-like объект
+        typed: Числа без ведущих нулей возвращаются числами, пустые ячейки - None
+
+    Returns:
+        Tuple[rows, close]: Генератор строк (кортежи значений) и функция
+        закрытия файла (ValueError, если файл не текстовый)
+    """
+    owned = not hasattr(source, "read")
+    if isinstance(source, bytes):
+        binary = io.BytesIO(source)
+    elif isinstance(source, str):
+        binary = open(source, "rb")
+    else:
+        binary = source
+
+    sample = binary.read(CSV_SAMPLE_SIZE)
+    binary.seek(0)
+
+    encoding = detect_encoding(sample)
+    if not is_text_sample(sample, encoding):
+        if owned:
+            binary.close()
+        raise ValueError("Неподдерживаемый формат файла: ожидается .xlsx, .xls или CSV")
+    delimiter = detect_delimiter(sample.decode(encoding, errors="ignore"))
+
+    stream = io.TextIOWrapper(binary, encoding=encoding, errors="replace", newline="")
+    reader = csv.reader(stream, delimiter=delimiter)
+
+    def rows() -> Iterator[Tuple[Any, ...]]:
+        for row in reader:
+            if typed:
+                yield tuple(_typed_value(value.strip()) for value in row)
+            else:
+                yield tuple(row)
+
+    def close() -> None:
+        # Чужой file-like объект не закрываем
+        if owned:
+            stream.close()
+        else:
+            stream.detach()
+
+    return rows(), close
@@ -1,56 +1,298 @@
 """
-Утилиты для парсинга Excel файлов
+Утилиты для парсинга Excel файлов (.xlsx, .xls) и CSV
 """
 import re
-from datetime import datetime
-from typing import List, Tuple, Optional, Dict, Any
+import zipfile
+from collections import Counter
+from xml.etree import ElementTree
+from datetime import datetime, date
+from functools import lru_cache
+from typing import List, Tuple, Optional, Dict, Any, Iterator, Union, BinaryIO, Callable
 import openpyxl
 from openpyxl.utils import get_column_letter
 from io import BytesIO
 
+from utils.csv_parser import open_csv_rows
+from utils.xls_parser import open_xls_rows, list_xls_sheets, first_xls_sheet
 
-def parse_excel_file(file_content: bytes) -> Tuple[List[str], List[List[Any]]]:
+# Сигнатуры форматов: .xlsx - ZIP архив, .xls - OLE2 контейнер
+XLSX_MAGIC = b"PK\x03\x04"
+XLS_MAGIC = b"\xd0\xcf\x11\xe0\xa1\xb1\x1a\xe1"
+
+
+def _is_empty_row(row: Tuple[Any, ...]) -> bool:
+    """Проверка, что строка полностью пустая"""
+    return all(cell is None or str(cell).strip() == '' for cell in row)
+
+
+def _process_row(row: Tuple[Any, ...]) -> List[str]:
+    """Конвертация значений строки в строки"""
+    return [
+        str(cell).strip() if cell is not None else ''
+        for cell in row
+    ]
+
+
+def _process_typed_row(row: Tuple[Any, ...]) -> List[Any]:
+    """Значения строки с исходными типами (строки - без пробелов по краям)"""
+    return [
+        cell.strip() if isinstance(cell, str) else cell
+        for cell in row
+    ]
+
+
+def _iter_data_rows(close: Callable[[], None], rows: Iterator[Tuple[Any, ...]], typed: bool = False) -> Iterator[List[Any]]:
+    """
+    Генератор обработанных строк данных
+
+    Файл закрывается (close), когда генератор исчерпан или закрыт.
+    """
+    process_row = _process_typed_row if typed else _process_row
+    try:
+        for row in rows:
+            # Пропускаем полностью пустые строки
+            if _is_empty_row(row):
+                continue
+            yield process_row(row)
+    finally:
+        close()
+
+
+def detect_file_format(source: Union[bytes, str, BinaryIO]) -> str:
+    """
+    Формат файла по сигнатуре (расширение не учитывается)
+
+    Returns:
+        xlsx, xls или csv (все, что не Excel; не текст отклоняет open_csv_rows)
+    """
+    if isinstance(source, bytes):
+        head = source[:8]
+    elif isinstance(source, str):
+        with open(source, "rb") as f:
+            head = f.read(8)
+    else:
+        position = source.tell()
+        head = source.read(8)
+        source.seek(position)
+
+    if head.startswith(XLSX_MAGIC):
+        return "xlsx"
+    if head.startswith(XLS_MAGIC):
+        return "xls"
+    return "csv"
+
+
+# Пространство имен SpreadsheetML (xl/workbook.xml)
+_SHEET_NS = {"main": "http://schemas.openxmlformats.org/spreadsheetml/2006/main"}
+
+
+def _read_workbook_xml(source: Union[bytes, str, BinaryIO]) -> ElementTree.Element:
+    """xl/workbook.xml книги .xlsx (листы не разбираются)"""
+    if isinstance(source, bytes):
+        source = BytesIO(source)
+
+    try:
+        with zipfile.ZipFile(source) as archive:
+            return ElementTree.fromstring(archive.read("xl/workbook.xml"))
+    except (zipfile.BadZipFile, KeyError, ElementTree.ParseError) as e:
+        raise ValueError(f"Не удалось прочитать список листов: {e}")
+
+
+def list_excel_sheets(source: Union[bytes, str, BinaryIO]) -> List[str]:
+    """
+    Имена видимых листов книги в порядке книги (у CSV листов нет)
+
+    Для .xlsx читается только xl/workbook.xml из архива, листы не разбираются.
+
+    Args:
+        source: Байты файла, путь к файлу или file-like объект
+    """
+    file_format = detect_file_format(source)
+    if file_format == "csv":
+        return []
+    if file_format == "xls":
+        return list_xls_sheets(source)
+
+    root = _read_workbook_xml(source)
+    return [
+        sheet.get("name")
+        for sheet in root.iterfind("main:sheets/main:sheet", _SHEET_NS)
+        if sheet.get("state", "visible") == "visible"
+    ]
+
+
+def default_excel_sheet(source: Union[bytes, str, BinaryIO]) -> Optional[str]:
+    """
+    Имя листа, который stream_excel_file читает без указания листа
+
+    .xlsx - активный лист (activeTab, как в openpyxl), .xls - первый лист,
+    у CSV листов нет (None).
+
+    Args:
+        source: Байты файла, путь к файлу или file-like объект
+    """
+    file_format = detect_file_format(source)
+    if file_format == "csv":
+        return None
+    if file_format == "xls":
+        return first_xls_sheet(source)
+
+    root = _read_workbook_xml(source)
+    active = 0
+    for view in root.iterfind("main:bookViews/main:workbookView", _SHEET_NS):
+        if view.get("activeTab") is not None:
+            active = int(view.get("activeTab"))
+            break
+
+    sheets = root.findall("main:sheets/main:sheet", _SHEET_NS)
+    return sheets[active].get("name") if 0 <= active < len(sheets) else None
+
+
+def stream_excel_file(
+    source: Union[bytes, str, BinaryIO],
+    typed: bool = False,
+    sheet: Optional[str] = None
+) -> Tuple[List[str], Iterator[List[Any]]]:
     """
-    Парсинг Excel файла
+    Потоковый парсинг файла: .xlsx, .xls или CSV (формат - по сигнатуре)
+
+    .xlsx читается в read-only режиме openpyxl: строки читаются из XML
+    листа по одной. CSV читается построчно без разбора XML, .xls - через
+    xlrd. Во всех форматах значения приводятся к одним типам, поэтому
+    дальше строки обрабатываются одинаково.
+
+    Args:
+        source: Байты файла, путь к файлу или file-like объект
+        typed: Сохранить типы значений (числа, даты, None) вместо строк
+        sheet: Имя листа (по умолчанию активный лист; для CSV не используется)
+
+    Returns:
+        Tuple[headers, rows]: Заголовки и генератор строк данных
+    """
+    file_format = detect_file_format(source)
+    if file_format == "csv":
+        rows, close = open_csv_rows(source, typed=typed)
+    elif file_format == "xls":
+        rows, close = open_xls_rows(source, sheet=sheet)
+    else:
+        rows, close = _open_xlsx_rows(source, sheet=sheet)
+
+    # Заголовки (первая строка)
+    header_row = next(rows, None)
+    if header_row is None:
+        close()
+        raise ValueError("Файл должен содержать минимум заголовок и одну строку данных")
+
+    headers = [str(cell) if cell is not None and cell != '' else f"Column_{i+1}"
+               for i, cell in enumerate(header_row)]
+
+    return headers, _iter_data_rows(close, rows, typed)
+
+
+def _open_xlsx_rows(
+    source: Union[bytes, str, BinaryIO],
+    sheet: Optional[str] = None
+) -> Tuple[Iterator[Tuple[Any, ...]], Callable[[], None]]:
+    """Строки листа книги .xlsx (read-only режим openpyxl) и функция закрытия книги"""
+    if isinstance(source, bytes):
+        source = BytesIO(source)
+
+    wb = openpyxl.load_workbook(source, read_only=True, data_only=True)
+    if sheet is None:
+        worksheet = wb.active
+    elif sheet in wb.sheetnames:
+        worksheet = wb[sheet]
+    else:
+        wb.close()
+        raise ValueError(f"Лист не найден: {sheet}")
+
+    # Многие программы пишут устаревший <dimension ref="A1"/>, и iter_rows
+    # обрезает лист по нему. Объявленная ширина остается минимальной
+    # шириной строк (пустые колонки в конце, как без read-only режима).
+    width = worksheet.max_column or 0
+    worksheet.reset_dimensions()
+
+    def rows() -> Iterator[Tuple[Any, ...]]:
+        for row in worksheet.iter_rows(values_only=True):
+            if len(row) < width:
+                row += (None,) * (width - len(row))
+            yield row
+
+    return rows(), wb.close
+
+
+def parse_excel_file(file_content: bytes, sheet: Optional[str] = None) -> Tuple[List[str], List[List[Any]]]:
+    """
+    Парсинг Excel (.xlsx, .xls) или CSV файла
 
     Args:
         file_content: Байты файла
+        sheet: Имя листа (по умолчанию активный лист)
 
     Returns:
         Tuple[headers, rows]: Заголовки и строки данных
     """
-    # Загрузка workbook
-    wb = openpyxl.load_workbook(BytesIO(file_content), data_only=True)
-    sheet = wb.active
-
-    # Извлечение данных
-    all_rows = list(sheet.iter_rows(values_only=True))
+    headers, rows_iter = stream_excel_file(file_content, sheet=sheet)
+    rows = list(rows_iter)
 
-    if len(all_rows) < 2:
+    if len(rows) == 0:
         raise ValueError("Файл должен содержать минимум заголовок и одну строку данных")
 
-    # Заголовки (первая строка)
-    headers = [str(cell) if cell is not None else f"Column_{i+1}"
-               for i, cell in enumerate(all_rows[0])]
-
-    # Данные (все строки кроме первой)
-    rows = []
-    for row in all_rows[1:]:
-        # Пропускаем полностью пустые строки
-        if all(cell is None or str(cell).strip() == '' for cell in row):
-            continue
-
-        # Конвертируем в строку и обрабатываем
-        processed_row = [
-            str(cell).strip() if cell is not None else ''
-            for cell in row
-        ]
-        rows.append(processed_row)
-
-    wb.close()
     return headers, rows
 
 
+# Форматы дат для проверки (компилируются один раз)
+DATE_PATTERNS = [
+    (re.compile(r'(\d{4})-(\d{1,2})-(\d{1,2})'), '%Y-%m-%d'),      # YYYY-MM-DD
+    (re.compile(r'(\d{1,2})\.(\d{1,2})\.(\d{4})'), '%d.%m.%Y'),    # DD.MM.YYYY
+    (re.compile(r'(\d{1,2})/(\d{1,2})/(\d{4})'), '%m/%d/%Y'),      # MM/DD/YYYY
+    (re.compile(r'(\d{1,2})-(\d{1,2})-(\d{4})'), '%d-%m-%Y'),      # DD-MM-YYYY
+]
+
+# Подсказки в заголовках колонок с датой
+DATE_HEADER_KEYWORDS = ('дата', 'date', 'время', 'time', 'день', 'day')
+
+# Количество строк, по которым определяется колонка даты
+DATE_SAMPLE_SIZE = 100
+
+
+@lru_cache(maxsize=100_000)
+def parse_date_string(value: str) -> Optional[datetime]:
+    """
+    Разбор даты из строки (результат кешируется)
+
+    Args:
+        value: Значение ячейки (без пробелов по краям)
+
+    Returns:
+        datetime объект или None
+    """
+    for pattern, date_format in DATE_PATTERNS:
+        match = pattern.search(value)
+        if match:
+            try:
+                parsed_date = datetime.strptime(match.group(0), date_format)
+
+                # Проверяем разумность даты (2000-2100)
+                if 2000 <= parsed_date.year <= 2100:
+                    return parsed_date
+            except ValueError:
+                continue
+
+    return None
+
+
+def parse_date_cell(cell: Any) -> Optional[datetime]:
+    """Разбор даты из значения ячейки (строка или дата Excel)"""
+    if isinstance(cell, datetime):
+        return cell if 2000 <= cell.year <= 2100 else None
+    if isinstance(cell, date):
+        return datetime(cell.year, cell.month, cell.day) if 2000 <= cell.year <= 2100 else None
+    if not cell or not isinstance(cell, str):
+        return None
+    return parse_date_string(cell.strip())
+
+
 def extract_date_from_row(row: List[str]) -> Optional[datetime]:
     """
     Извлечение даты из строки данных
@@ -61,36 +303,74 @@ def extract_date_from_row(row: List[str]) -> Optional[datetime]:
     Returns:
         datetime объект или None
     """
-    # Форматы дат для проверки
-    date_patterns = [
-        (r'(\d{4})-(\d{1,2})-(\d{1,2})', '%Y-%m-%d'),      # YYYY-MM-DD
-        (r'(\d{1,2})\.(\d{1,2})\.(\d{4})', '%d.%m.%Y'),    # DD.MM.YYYY
-        (r'(\d{1,2})/(\d{1,2})/(\d{4})', '%m/%d/%Y'),      # MM/DD/YYYY
-        (r'(\d{1,2})-(\d{1,2})-(\d{4})', '%d-%m-%Y'),      # DD-MM-YYYY
-    ]
-
     # Проверяем каждую ячейку в строке
     for cell in row:
-        if not cell or not isinstance(cell, str):
-            continue
+        parsed_date = parse_date_cell(cell)
+        if parsed_date:
+            return parsed_date
 
-        cell = cell.strip()
+    return None
 
-        # Пробуем распарсить по паттернам
-        for pattern, date_format in date_patterns:
-            match = re.search(pattern, cell)
-            if match:
-                try:
-                    date_str = match.group(0)
-                    parsed_date = datetime.strptime(date_str, date_format)
 
-                    # Проверяем разумность даты (2000-2100)
-                    if 2000 <= parsed_date.year <= 2100:
+class DateExtractor:
+    """
+    Извлечение дат с определением колонки даты
+
+    Первые sample_size строк проверяются целиком, как в extract_date_from_row,
+    и запоминается, в какой колонке нашлась дата. Дальше разбираются только
+    найденные колонки (чаще встречавшиеся - первыми). Если в выборке дат нет,
+    используются колонки с датой в заголовке.
+    """
+
+    def __init__(self, headers: List[str], sample_size: int = DATE_SAMPLE_SIZE):
+        self.sample_size = sample_size
+        self.date_columns: Optional[List[int]] = None
+
+        self._header_columns = [
+            i for i, header in enumerate(headers)
+            if any(keyword in str(header).lower() for keyword in DATE_HEADER_KEYWORDS)
+        ]
+        self._hits: Counter = Counter()
+        self._sampled = 0
+
+    def extract(self, row: List[Any]) -> Optional[datetime]:
+        """
+        Извлечение даты из строки данных
+
+        Args:
+            row: Строка данных
+
+        Returns:
+            datetime объект или None
+        """
+        if self.date_columns is not None:
+            for i in self.date_columns:
+                if i < len(row):
+                    parsed_date = parse_date_cell(row[i])
+                    if parsed_date:
                         return parsed_date
-                except (ValueError, AttributeError):
-                    continue
+            return None
 
-    return None
+        # Фаза выборки: полная проверка строки
+        result = None
+        for i, cell in enumerate(row):
+            result = parse_date_cell(cell)
+            if result:
+                self._hits[i] += 1
+                break
+
+        self._sampled += 1
+        if self._sampled >= self.sample_size:
+            self._lock_columns()
+
+        return result
+
+    def _lock_columns(self) -> None:
+        """Фиксация колонок даты по результатам выборки"""
+        if self._hits:
+            self.date_columns = [i for i, _ in self._hits.most_common()]
+        else:
+            self.date_columns = self._header_columns
 
 
 def get_period_from_date(date: datetime) -> str:
@@ -158,7 +438,7 @@ def validate_excel_structure(headers: List[str], rows: List[List[Any]]) -> Dict[
                 float(cell)
                 stats["column_types"][col_name]["numeric"] += 1
             except (ValueError, TypeError):
-                if extract_date_from_row([cell]):
+                if parse_date_cell(cell):
                     stats["column_types"][col_name]["date"] += 1
                     stats["has_dates"] = True
                 else:
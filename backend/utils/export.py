@@ -0,0 +1,91 @@
+"""
+Потоковый экспорт записей в Excel (write-only) и CSV
+"""
+import csv
+import io
+import os
+import tempfile
+from typing import List, Iterable, Iterator, Dict, Any
+
+import openpyxl
+from openpyxl.cell import WriteOnlyCell
+from openpyxl.styles import Font, PatternFill
+
+# Количество строк, читаемых из БД за один fetch (server-side cursor)
+EXPORT_BATCH_SIZE = int(os.getenv("EXPORT_BATCH_SIZE", "2000"))
+
+# Размер блока, отдаваемого клиенту
+EXPORT_CHUNK_SIZE = 64 * 1024
+
+XLSX_MEDIA_TYPE = "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet"
+CSV_MEDIA_TYPE = "text/csv"
+
+
+def iter_csv_export(headers: List[str], rows: Iterable[Dict[str, Any]]) -> Iterator[bytes]:
+    """
+    CSV экспорт: байты отдаются по мере формирования строк
+
+    Args:
+        headers: Заголовки колонок
+        rows: Данные записей (Record.data)
+    """
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+
+    # BOM, чтобы Excel открыл UTF-8 с кириллицей
+    buffer.write('\ufeff')
+    writer.writerow(['#'] + headers)
+
+    for i, data in enumerate(rows, 1):
+        writer.writerow([i] + [data.get(h, '') for h in headers])
+
+        if buffer.tell() >= EXPORT_CHUNK_SIZE:
+            yield buffer.getvalue().encode('utf-8')
+            buffer.seek(0)
+            buffer.truncate()
+
+    yield buffer.getvalue().encode('utf-8')
+
+
+def iter_xlsx_export(headers: List[str], rows: Iterable[Dict[str, Any]]) -> Iterator[bytes]:
+    """
+    Excel экспорт через write-only workbook
+
+    Строки сразу сбрасываются во временный файл openpyxl, поэтому память
+    не растет с числом строк; готовый файл отдается блоками с диска.
+
+    Args:
+        headers: Заголовки колонок
+        rows: Данные записей (Record.data)
+    """
+    wb = openpyxl.Workbook(write_only=True)
+    ws = wb.create_sheet("VendHub Database")
+
+    # Стиль заголовков
+    header_fill = PatternFill(start_color="667eea", end_color="667eea", fill_type="solid")
+    header_font = Font(bold=True, color="FFFFFF")
+
+    header_cells = []
+    for value in ['#'] + headers:
+        cell = WriteOnlyCell(ws, value=value)
+        cell.fill = header_fill
+        cell.font = header_font
+        header_cells.append(cell)
+    ws.append(header_cells)
+
+    # Данные
+    for i, data in enumerate(rows, 1):
+        ws.append([i] + [data.get(h, '') for h in headers])
+
+    fd, path = tempfile.mkstemp(prefix="vendhub_export_", suffix=".xlsx")
+    os.close(fd)
+    try:
+        wb.save(path)
+        with open(path, "rb") as f:
+            while True:
+                chunk = f.read(EXPORT_CHUNK_SIZE)
+                if not chunk:
+                    break
+                yield chunk
+    finally:
+        os.remove(path)
@@ -0,0 +1,75 @@
+"""
+Удаление файлов пакетными DELETE (без загрузки записей в ORM)
+"""
+import os
+from collections import Counter
+from typing import Callable, Optional
+
+from sqlalchemy import delete, select
+from sqlalchemy.orm import Session
+
+from models import File, Record
+from utils.period_stats import subtract_period_counts, NO_PERIOD
+
+# Записей в одном DELETE (каждый пакет - отдельная короткая транзакция)
+FILE_DELETE_BATCH_SIZE = int(os.getenv("FILE_DELETE_BATCH_SIZE", "10000"))
+
+# Файлы с большим числом строк удаляются в фоновой задаче
+FILE_DELETE_BACKGROUND_ROWS = int(os.getenv("FILE_DELETE_BACKGROUND_ROWS", "50000"))
+
+
+def delete_record_batch(db: Session, user_id: int, file_id: int, batch_size: int) -> int:
+    """
+    Удаление пакета записей файла со сводкой по периодам в той же транзакции
+
+    Returns:
+        Количество удаленных записей
+    """
+    batch_ids = select(Record.id).where(Record.file_id == file_id).limit(batch_size).scalar_subquery()
+    periods = db.execute(
+        delete(Record).where(Record.id.in_(batch_ids)).returning(Record.period)
+    ).scalars().all()
+
+    subtract_period_counts(db, user_id, Counter(period or NO_PERIOD for period in periods))
+    return len(periods)
+
+
+def delete_file_data(
+    db: Session,
+    file_id: int,
+    user_id: int,
+    batch_size: Optional[int] = None,
+    progress_callback: Optional[Callable[[int], None]] = None
+) -> int:
+    """
+    Удаление записей файла пакетами, затем самого файла
+
+    Пакеты коммитятся по одному: сводка period_stats всегда совпадает
+    с оставшимися записями, а прерванное удаление можно повторить.
+
+    Args:
+        db: Database session
+        file_id: ID файла
+        user_id: ID владельца файла
+        batch_size: Записей в пакете (по умолчанию FILE_DELETE_BATCH_SIZE)
+        progress_callback: Вызывается с числом удаленных записей после каждого пакета
+
+    Returns:
+        Количество удаленных записей
+    """
+    batch_size = batch_size or FILE_DELETE_BATCH_SIZE
+    deleted = 0
+
+    while True:
+        removed = delete_record_batch(db, user_id, file_id, batch_size)
+        db.commit()
+        deleted += removed
+
+        if progress_callback:
+            progress_callback(deleted)
+        if removed < batch_size:
+            break
+
+    db.execute(delete(File).where(File.id == file_id))
+    db.commit()
+    return deleted
@@ -0,0 +1,180 @@
+"""
+Пакетная загрузка строк Excel в таблицу records
+"""
+import os
+import time
+from collections import Counter
+from typing import List, Iterable, Dict, Any, Optional, Callable
+
+from sqlalchemy.orm import Session
+
+from models import File, Record
+from utils.excel_parser import DateExtractor, get_period_from_date, create_unique_key
+from utils.period_stats import NO_PERIOD
+from utils.sheet_stats import SheetStatsAccumulator
+from utils.typed_storage import ColumnTypeAccumulator, serialize_cell
+
+# Количество строк в одном multi-row INSERT
+INGEST_BATCH_SIZE = int(os.getenv("INGEST_BATCH_SIZE", "5000"))
+
+# Область дедупликации: file - внутри файла, user - по всем файлам пользователя
+INGEST_DEDUP_SCOPE = os.getenv("INGEST_DEDUP_SCOPE", "file")
+
+
+def build_search_text(row: List[Any]) -> str:
+    """Текст для поиска: непустые значения строки в нижнем регистре"""
+    return "\n".join(str(cell) for cell in row if cell not in (None, '')).lower()
+
+
+def _existing_hashes(db: Session, user_id: int, hashes: List[str]) -> set:
+    """Хеши из пакета, которые уже есть в файлах пользователя (idx_records_row_hash)"""
+    rows = db.query(Record.row_hash).join(File).filter(
+        File.user_id == user_id,
+        Record.row_hash.in_(hashes)
+    ).distinct()
+    return {row_hash for (row_hash,) in rows}
+
+
+def _flush_batch(
+    db: Session,
+    batch: List[Dict[str, Any]],
+    period_counts: Counter,
+    user_id: Optional[int] = None
+) -> int:
+    """
+    Вставка пакета записей одним executemany (multi-row INSERT)
+
+    Если передан user_id, строки, уже загруженные пользователем
+    из других файлов, пропускаются. Вставленные записи учитываются
+    в period_counts (для сводки period_stats).
+
+    Returns:
+        Количество вставленных записей
+    """
+    if batch and user_id is not None:
+        existing = _existing_hashes(db, user_id, [item["row_hash"] for item in batch])
+        if existing:
+            batch = [item for item in batch if item["row_hash"] not in existing]
+
+    if batch:
+        db.execute(Record.__table__.insert(), batch)
+        period_counts.update(item["period"] or NO_PERIOD for item in batch)
+    return len(batch)
+
+
+def ingest_rows(
+    db: Session,
+    file_id: int,
+    headers: List[str],
+    rows: Iterable[List[Any]],
+    batch_size: Optional[int] = None,
+    user_id: Optional[int] = None,
+    progress_callback: Optional[Callable[[int, int], None]] = None,
+    typed: bool = False
+) -> Dict[str, Any]:
+    """
+    Загрузка строк файла в records пакетами
+
+    Дубликаты внутри файла отбрасываются в памяти по row_hash (create_unique_key),
+    поэтому отдельный SELECT на каждую строку не нужен. При INGEST_DEDUP_SCOPE=user
+    каждый пакет дополнительно сверяется с хешами других файлов пользователя.
+
+    В режиме typed строки приходят с исходными типами (stream_excel_file(typed=True)):
+    значения сохраняются массивом в Record.cells без заголовков, а типы колонок
+    возвращаются в column_types (для File.column_types).
+
+    Args:
+        db: Database session (commit выполняет вызывающий код)
+        file_id: ID файла, к которому относятся записи
+        headers: Заголовки колонок
+        rows: Строки данных
+        batch_size: Размер пакета (по умолчанию INGEST_BATCH_SIZE)
+        user_id: Владелец файла (нужен для INGEST_DEDUP_SCOPE=user)
+        progress_callback: Вызывается после каждого пакета с (rows_parsed, records_added)
+        typed: Типизированное хранение (Record.cells вместо Record.data)
+
+    Returns:
+        Статистика загрузки, статистика по колонкам (см. validate_excel_structure),
+        количество добавленных записей по периодам и типы колонок (typed)
+    """
+    batch_size = batch_size or INGEST_BATCH_SIZE
+    dedup_user_id = user_id if INGEST_DEDUP_SCOPE == "user" else None
+    started = time.perf_counter()
+
+    date_extractor = DateExtractor(headers)
+    sheet_stats = SheetStatsAccumulator(headers)
+    column_types = ColumnTypeAccumulator(headers) if typed else None
+    stats_rows = []
+    period_counts = Counter()
+    seen = set()
+    batch = []
+    rows_parsed = 0
+    records_added = 0
+
+    for row in rows:
+        rows_parsed += 1
+
+        if typed:
+            column_types.update(row)
+            # Пустые ячейки как в строковом режиме: хеш и статистика не зависят от режима
+            text_row = ['' if cell is None else cell for cell in row]
+        else:
+            text_row = row
+
+        # Статистика по колонкам считается пакетами (pandas)
+        stats_rows.append(text_row)
+        if len(stats_rows) >= batch_size:
+            sheet_stats.update(stats_rows)
+            stats_rows = []
+
+        # Уникальность в пределах файла (file_id + row_hash)
+        row_hash = create_unique_key(text_row)
+        if row_hash in seen:
+            continue
+        seen.add(row_hash)
+
+        # Извлекаем дату
+        date_obj = date_extractor.extract(row)
+
+        if typed:
+            # Значения по порядку заголовков (заголовки хранятся в File.headers)
+            cells = [serialize_cell(cell) for cell in row[:len(headers)]]
+            row_data = None
+            search_source = cells
+        else:
+            cells = None
+            row_data = {headers[i]: row[i] for i in range(min(len(headers), len(row)))}
+            search_source = row
+
+        batch.append({
+            "file_id": file_id,
+            "data": row_data,
+            "cells": cells,
+            "date_field": date_obj.date() if date_obj else None,
+            "period": get_period_from_date(date_obj) if date_obj else None,
+            "row_hash": row_hash,
+            "search_text": build_search_text(search_source)
+        })
+
+        if len(batch) >= batch_size:
+            records_added += _flush_batch(db, batch, period_counts, dedup_user_id)
+            batch = []
+
+            if progress_callback:
+                progress_callback(rows_parsed, records_added)
+
+    records_added += _flush_batch(db, batch, period_counts, dedup_user_id)
+    sheet_stats.update(stats_rows)
+
+    elapsed = time.perf_counter() - started
+
+    return {
+        "rows_parsed": rows_parsed,
+        "records_added": records_added,
+        "duplicates_skipped": rows_parsed - records_added,
+        "elapsed_seconds": round(elapsed, 3),
+        "rows_per_second": round(rows_parsed / elapsed, 1) if elapsed > 0 else 0.0,
+        "stats": sheet_stats.result(),
+        "period_counts": dict(period_counts),
+        "column_types": column_types.result() if typed else None
+    }
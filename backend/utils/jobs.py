@@ -0,0 +1,609 @@
+"""
+Фоновые задачи загрузки и удаления файлов (пул процессов)
+"""
+import multiprocessing
+import os
+import socket
+import threading
+from concurrent.futures import Executor, Future, ProcessPoolExecutor, ThreadPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from datetime import datetime, timedelta, timezone
+from typing import Dict, Any, Optional, Callable
+
+from loguru import logger
+from sqlalchemy import func, or_
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import Session
+
+from database import SessionLocal, engine
+from models import File, IngestionJob
+from utils.cache import invalidate_user
+from utils.excel_parser import stream_excel_file, default_excel_sheet
+from utils.file_deletion import delete_file_data
+from utils.ingestion import ingest_rows
+from utils.partitions import ensure_period_partitions
+from utils.period_stats import add_period_counts
+from utils.typed_storage import typed_storage_enabled
+from utils.uploads import retain_temp_file, release_temp_file
+
+# Количество процессов-воркеров (0 - выполнять в потоке текущего процесса)
+INGEST_WORKERS = int(os.getenv("INGEST_WORKERS", str(os.cpu_count() or 1)))
+
+# Статусы задач, которые еще выполняются
+ACTIVE_STATUSES = ("pending", "running")
+
+# Как часто процесс API отмечает свои задачи (heartbeat_at) и проверяет чужие, сек
+JOB_HEARTBEAT_SECONDS = int(os.getenv("JOB_HEARTBEAT_SECONDS", "15"))
+# Задача без отметки дольше этого считается потерянной (процесс API остановлен)
+JOB_STALE_SECONDS = int(os.getenv("JOB_STALE_SECONDS", "120"))
+
+# Владелец задач, поставленных этим процессом API (ingestion_jobs.owner)
+OWNER_ID = f"{socket.gethostname()}:{os.getpid()}"
+
+_executor: Optional[Executor] = None
+_executor_lock = threading.Lock()
+
+# Задачи, поставленные в пул этим процессом и еще не завершенные
+_active_jobs: Dict[int, Future] = {}
+
+_heartbeat_stop = threading.Event()
+
+
+def get_executor() -> Executor:
+    """Получить (создать при первом вызове) пул воркеров"""
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            if INGEST_WORKERS > 0:
+                # spawn: воркер не наследует соединения и потоки родителя
+                _executor = ProcessPoolExecutor(
+                    max_workers=INGEST_WORKERS,
+                    mp_context=multiprocessing.get_context("spawn")
+                )
+            else:
+                _executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="ingest")
+        return _executor
+
+
+def _reset_executor(broken: Executor) -> None:
+    """
+    Замена сломанного пула (воркер убит, например, по OOM)
+
+    После гибели воркера ProcessPoolExecutor отклоняет все новые задачи,
+    поэтому пул отбрасывается и создается заново при следующем вызове get_executor.
+    """
+    global _executor
+    with _executor_lock:
+        if _executor is not broken:
+            return
+        _executor = None
+    logger.warning("Ingestion worker pool is broken, recreating it")
+    broken.shutdown(wait=False, cancel_futures=True)
+
+
+def shutdown_executor() -> None:
+    """Остановка пула: текущие задачи дорабатывают, задачи в очереди отменяются"""
+    global _executor
+    _heartbeat_stop.set()
+    with _executor_lock:
+        executor, _executor = _executor, None
+    if executor is not None:
+        executor.shutdown(wait=True, cancel_futures=True)
+
+
+def is_job_active(job_id: int) -> bool:
+    """Задача выполняется (или ждет в очереди) пулом этого процесса"""
+    future = _active_jobs.get(job_id)
+    return future is not None and not future.done()
+
+
+def _heartbeat_fresh(job: IngestionJob) -> bool:
+    """Процесс-владелец отмечал задачу не позже JOB_STALE_SECONDS назад"""
+    heartbeat = job.heartbeat_at or job.created_at
+    if heartbeat is None:
+        return False
+    if heartbeat.tzinfo is None:
+        # SQLite возвращает время без зоны (записано в UTC)
+        heartbeat = heartbeat.replace(tzinfo=timezone.utc)
+    return heartbeat >= _now() - timedelta(seconds=JOB_STALE_SECONDS)
+
+
+def find_active_job(db: Session, *criteria: Any) -> Optional[IngestionJob]:
+    """
+    Незавершенная задача по условиям, если она действительно выполняется
+
+    Задача жива, пока она в пуле этого процесса или ее heartbeat_at
+    свежий (задачу отмечает процесс API, который ее поставил). Потерянная
+    задача (процесс остановлен) переводится в failed и не возвращается,
+    чтобы файл можно было загрузить (удалить) заново. Падение воркера
+    и ошибку постановки в пул обрабатывают _on_job_done и _submit_job.
+    """
+    jobs = db.query(IngestionJob).filter(
+        IngestionJob.status.in_(ACTIVE_STATUSES),
+        *criteria
+    ).all()
+
+    active_job = None
+    stale = False
+    for job in jobs:
+        if is_job_active(job.id) or _heartbeat_fresh(job):
+            active_job = active_job or job
+            continue
+        logger.warning(f"Job {job.id} is not running anymore, marking it as failed")
+        job.status = "failed"
+        job.error = "File processing failed"
+        job.finished_at = _now()
+        stale = True
+
+    if stale:
+        db.commit()
+    return active_job
+
+
+def touch_active_jobs() -> int:
+    """
+    Отметка heartbeat_at задач, которые выполняет (держит в очереди) этот процесс
+
+    Returns:
+        Количество отмеченных задач
+    """
+    job_ids = [job_id for job_id, future in list(_active_jobs.items()) if not future.done()]
+    if not job_ids:
+        return 0
+
+    db = SessionLocal()
+    try:
+        count = db.query(IngestionJob).filter(
+            IngestionJob.id.in_(job_ids),
+            IngestionJob.status.in_(ACTIVE_STATUSES)
+        ).update({"heartbeat_at": _now()}, synchronize_session=False)
+        db.commit()
+    finally:
+        db.close()
+    return count
+
+
+def fail_stale_jobs() -> int:
+    """
+    Перевод потерянных задач в failed
+
+    Задача pending/running без отметки дольше JOB_STALE_SECONDS осталась
+    от остановленного процесса API (перезапуск, падение) и уже никем не
+    выполняется. Задачи живых процессов, в том числе других экземпляров
+    API, не трогаются.
+
+    Returns:
+        Количество исправленных задач
+    """
+    cutoff = _now() - timedelta(seconds=JOB_STALE_SECONDS)
+    db = SessionLocal()
+    try:
+        query = db.query(IngestionJob).filter(
+            IngestionJob.status.in_(ACTIVE_STATUSES),
+            func.coalesce(IngestionJob.heartbeat_at, IngestionJob.created_at) < cutoff
+        )
+        own_jobs = list(_active_jobs)
+        if own_jobs:
+            query = query.filter(IngestionJob.id.notin_(own_jobs))
+        count = query.update(
+            {"status": "failed", "error": "Interrupted by server restart", "finished_at": _now()},
+            synchronize_session=False
+        )
+        db.commit()
+    finally:
+        db.close()
+
+    if count:
+        logger.warning(f"Marked {count} interrupted jobs as failed")
+    return count
+
+
+def start_job_heartbeat() -> threading.Thread:
+    """
+    Фоновый поток процесса API: отметка своих задач и сброс потерянных
+
+    Процессов API может быть несколько (несколько воркеров uvicorn,
+    экземпляров за балансировщиком): каждый отмечает только свои задачи.
+    """
+    def run():
+        while not _heartbeat_stop.wait(JOB_HEARTBEAT_SECONDS):
+            try:
+                touch_active_jobs()
+                fail_stale_jobs()
+            except Exception as e:
+                logger.warning(f"Job heartbeat failed: {str(e)}")
+
+    _heartbeat_stop.clear()
+    thread = threading.Thread(target=run, name="job-heartbeat", daemon=True)
+    thread.start()
+    return thread
+
+
+def _now() -> datetime:
+    """Текущее время (UTC)"""
+    return datetime.now(timezone.utc)
+
+
+def _update_job(job_id: int, **values: Any) -> None:
+    """
+    Обновление статуса задачи в отдельной сессии
+
+    Основная транзакция загрузки еще не закоммичена, поэтому прогресс
+    пишется отдельно, чтобы его было видно при опросе /api/jobs/{id}.
+    """
+    db = SessionLocal()
+    try:
+        db.query(IngestionJob).filter(IngestionJob.id == job_id).update(values)
+        db.commit()
+    finally:
+        db.close()
+
+
+def _report_progress(job_id: int, rows_parsed: int, records_added: int) -> None:
+    """Запись прогресса задачи и отметки heartbeat_at (ошибка записи не прерывает загрузку)"""
+    try:
+        _update_job(job_id, rows_parsed=rows_parsed, records_added=records_added, heartbeat_at=_now())
+    except Exception as e:
+        logger.warning(f"Ingestion job {job_id} progress update failed: {str(e)}")
+
+
+def create_job(
+    db: Session,
+    user_id: int,
+    filename: str,
+    content_hash: Optional[str] = None,
+    **values: Any
+) -> IngestionJob:
+    """Создание задачи загрузки (по умолчанию в статусе pending, владелец - этот процесс)"""
+    values.setdefault("status", "pending")
+    values.setdefault("owner", OWNER_ID)
+    values.setdefault("heartbeat_at", _now())
+    job = IngestionJob(user_id=user_id, filename=filename, content_hash=content_hash, **values)
+    db.add(job)
+    db.commit()
+    db.refresh(job)
+    return job
+
+
+def finish_job(job_id: int, user_id: int, result: Dict[str, Any]) -> None:
+    """
+    Запись итогового статуса задачи после сброса кеша пользователя
+
+    Клиент, увидевший статус completed, сразу запрашивает данные: версия
+    кеша к этому моменту уже должна быть увеличена, иначе он получит
+    ответ, закешированный до загрузки.
+    """
+    invalidate_user(user_id)
+    _update_job(job_id, **result)
+
+
+def run_ingestion_job(job_id: int, file_path: str) -> Dict[str, Any]:
+    """
+    Выполнение задачи загрузки (в процессе-воркере)
+
+    Итоговый статус не пишется воркером: он возвращается и записывается
+    в finish_job после сброса кеша.
+
+    Args:
+        job_id: ID задачи
+        file_path: Путь к временному файлу
+
+    Returns:
+        Итоговые поля задачи (status, file_id, статистика загрузки)
+    """
+    _update_job(job_id, status="running", started_at=_now(), heartbeat_at=_now())
+
+    db = SessionLocal()
+    try:
+        job = db.get(IngestionJob, job_id)
+
+        # Тот же лист мог загрузить другой процесс API, пока задача ждала очереди
+        if job.content_hash:
+            existing_file = _find_uploaded_file(
+                db, job.user_id, job.content_hash, job.sheet_name, _default_sheet(file_path)
+            )
+            if existing_file:
+                return {
+                    "status": "duplicate",
+                    "file_id": existing_file.id,
+                    "rows_parsed": existing_file.row_count,
+                    "finished_at": _now()
+                }
+
+        typed = typed_storage_enabled()
+        headers, rows = stream_excel_file(file_path, typed=typed, sheet=job.sheet_name)
+
+        db_file = File(
+            user_id=job.user_id,
+            filename=job.filename,
+            row_count=0,
+            headers=headers,
+            content_hash=job.content_hash,
+            sheet_name=job.sheet_name
+        )
+        db.add(db_file)
+        db.flush()  # Получаем ID файла
+
+        # SQLite допускает только одного писателя: прогресс пишется только в PostgreSQL
+        progress_callback = None
+        if db.get_bind().dialect.name != "sqlite":
+            progress_callback = lambda parsed, added: _report_progress(job_id, parsed, added)
+
+        ingest_stats = ingest_rows(
+            db, db_file.id, headers, rows,
+            user_id=job.user_id,
+            progress_callback=progress_callback,
+            typed=typed
+        )
+
+        if ingest_stats["rows_parsed"] == 0:
+            raise ValueError("File contains no data rows")
+
+        db_file.row_count = ingest_stats["rows_parsed"]
+        db_file.column_types = ingest_stats["column_types"]
+        add_period_counts(db, job.user_id, ingest_stats["period_counts"])
+        db.commit()
+
+        # Секции новых периодов (записи уже закоммичены, ошибка не прерывает задачу)
+        try:
+            ensure_period_partitions(engine, ingest_stats["period_counts"].keys())
+        except Exception as e:
+            logger.warning(f"Partition maintenance failed for job {job_id}: {str(e)}")
+
+        logger.info(
+            f"File ingested: {job.filename}, {ingest_stats['records_added']} records added "
+            f"({ingest_stats['rows_per_second']} rows/s), job {job_id}"
+        )
+        return {
+            "status": "completed",
+            "file_id": db_file.id,
+            "rows_parsed": ingest_stats["rows_parsed"],
+            "records_added": ingest_stats["records_added"],
+            "rows_per_second": ingest_stats["rows_per_second"],
+            "stats": ingest_stats["stats"],
+            "finished_at": _now()
+        }
+
+    except ValueError as e:
+        db.rollback()
+        return {"status": "failed", "error": str(e), "finished_at": _now()}
+    except Exception as e:
+        logger.error(f"Ingestion job {job_id} error: {str(e)}")
+        db.rollback()
+        return {"status": "failed", "error": "File processing failed", "finished_at": _now()}
+    finally:
+        db.close()
+
+
+def run_file_deletion_job(job_id: int, file_id: int, user_id: int) -> Dict[str, Any]:
+    """
+    Удаление большого файла пакетами (в процессе-воркере)
+
+    Прогресс (удалено записей) пишется в rows_parsed задачи.
+
+    Args:
+        job_id: ID задачи
+        file_id: ID удаляемого файла
+        user_id: ID владельца файла
+
+    Returns:
+        Итоговые поля задачи (записываются в finish_job после сброса кеша)
+    """
+    _update_job(job_id, status="running", started_at=_now(), heartbeat_at=_now())
+
+    db = SessionLocal()
+    try:
+        progress_callback = None
+        if db.get_bind().dialect.name != "sqlite":
+            progress_callback = lambda deleted: _report_progress(job_id, deleted, 0)
+
+        deleted = delete_file_data(db, file_id, user_id, progress_callback=progress_callback)
+
+        logger.info(f"File {file_id} deleted in background: {deleted} records, job {job_id}")
+        return {"status": "completed", "rows_parsed": deleted, "finished_at": _now()}
+
+    except Exception as e:
+        logger.error(f"Deletion job {job_id} error: {str(e)}")
+        db.rollback()
+        return {"status": "failed", "error": "File deletion failed", "finished_at": _now()}
+    finally:
+        db.close()
+
+
+def _submit_job(job_id: int, file_path: Optional[str], user_id: int, func: Callable, *args: Any) -> Future:
+    """
+    Постановка задачи в пул с пересозданием сломанного пула
+
+    Если задачу не удалось поставить, она сразу переводится в failed
+    (иначе запись pending никто не обработает), а ошибка пробрасывается.
+    """
+    executor = get_executor()
+    try:
+        try:
+            future = executor.submit(func, *args)
+        except BrokenProcessPool:
+            _reset_executor(executor)
+            executor = get_executor()
+            future = executor.submit(func, *args)
+    except BaseException as e:
+        logger.error(f"Job {job_id} submission failed: {str(e)}")
+        _update_job(job_id, status="failed", error="File processing failed", finished_at=_now())
+        raise
+
+    _active_jobs[job_id] = future
+    future.add_done_callback(lambda f: _on_job_done(job_id, file_path, user_id, executor, f))
+    return future
+
+
+def submit_deletion_job(job_id: int, file_id: int, user_id: int) -> Future:
+    """Постановка задачи удаления файла в пул воркеров"""
+    return _submit_job(job_id, None, user_id, run_file_deletion_job, job_id, file_id, user_id)
+
+
+def submit_ingestion_job(job_id: int, file_path: str, user_id: int) -> Future:
+    """
+    Постановка задачи загрузки в пул воркеров
+
+    Задача держит ссылку на временный файл (retain_temp_file): файл
+    удаляется после завершения последней задачи, читающей его.
+    Кеш пользователя сбрасывается до записи итогового статуса задачи.
+    """
+    retain_temp_file(file_path)
+    try:
+        return _submit_job(job_id, file_path, user_id, run_ingestion_job, job_id, file_path)
+    except BaseException:
+        release_temp_file(file_path)
+        raise
+
+
+def _default_sheet(file_path: str) -> Optional[str]:
+    """Лист по умолчанию (None, если книга не читается: ошибку покажет задача)"""
+    try:
+        return default_excel_sheet(file_path)
+    except ValueError:
+        return None
+
+
+def _same_sheet(column: Any, sheet: Optional[str], default_sheet: Optional[str]) -> Any:
+    """
+    Условие на лист файла (задачи)
+
+    sheet_name = None в ранее загруженных файлах - лист по умолчанию
+    (default_excel_sheet), поэтому он совпадает с этим листом.
+    """
+    if sheet is None:
+        return column.is_(None)
+    if sheet == default_sheet:
+        return or_(column == sheet, column.is_(None))
+    return column == sheet
+
+
+def queue_ingestion(
+    db: Session,
+    user_id: int,
+    filename: str,
+    file_path: str,
+    content_hash: str,
+    sheet: Optional[str] = None
+) -> IngestionJob:
+    """
+    Задача загрузки файла (листа) с проверкой повторной загрузки
+
+    Отпечаток загрузки - SHA-256 файла и имя листа: без указания листа
+    берется лист по умолчанию, поэтому одиночная и пакетная загрузка
+    одной книги совпадают. Уже загруженный лист не парсится повторно
+    (задача со статусом duplicate и ссылкой на существующий файл), для
+    листа, который уже обрабатывается, возвращается активная задача
+    (find_active_job).
+
+    Args:
+        db: Database session
+        user_id: ID пользователя
+        filename: Имя загруженного файла
+        file_path: Путь к временному файлу
+        content_hash: SHA-256 файла
+        sheet: Имя листа (None - лист по умолчанию)
+
+    Returns:
+        Задача загрузки
+    """
+    default_sheet = _default_sheet(file_path)
+    if sheet is None:
+        sheet = default_sheet
+
+    existing_job = _find_uploaded(db, user_id, filename, content_hash, sheet, default_sheet)
+    if existing_job:
+        return existing_job
+
+    try:
+        job = create_job(db, user_id, filename, content_hash, sheet_name=sheet)
+    except IntegrityError:
+        # Тот же лист одновременно поставил другой запрос (uq_jobs_active_upload)
+        db.rollback()
+        existing_job = _find_uploaded(db, user_id, filename, content_hash, sheet, default_sheet)
+        if existing_job:
+            return existing_job
+        raise
+
+    submit_ingestion_job(job.id, file_path, user_id)
+    return job
+
+
+def _find_uploaded(
+    db: Session,
+    user_id: int,
+    filename: str,
+    content_hash: str,
+    sheet: Optional[str],
+    default_sheet: Optional[str]
+) -> Optional[IngestionJob]:
+    """
+    Задача для уже загруженного листа (duplicate) или листа в обработке
+
+    Returns:
+        Задача или None, если лист нужно загружать
+    """
+    existing_file = _find_uploaded_file(db, user_id, content_hash, sheet, default_sheet)
+    if existing_file:
+        logger.info(f"Duplicate upload: {filename} matches file {existing_file.id}")
+        return create_job(
+            db, user_id, filename, content_hash,
+            status="duplicate", file_id=existing_file.id, sheet_name=sheet,
+            rows_parsed=existing_file.row_count, finished_at=_now()
+        )
+
+    return find_active_job(
+        db,
+        IngestionJob.user_id == user_id,
+        IngestionJob.content_hash == content_hash,
+        _same_sheet(IngestionJob.sheet_name, sheet, default_sheet)
+    )
+
+
+def _find_uploaded_file(
+    db: Session,
+    user_id: int,
+    content_hash: str,
+    sheet: Optional[str],
+    default_sheet: Optional[str]
+) -> Optional[File]:
+    """Уже загруженный файл с тем же содержимым и листом"""
+    return db.query(File).filter(
+        File.user_id == user_id,
+        File.content_hash == content_hash,
+        _same_sheet(File.sheet_name, sheet, default_sheet)
+    ).first()
+
+
+def _on_job_done(
+    job_id: int,
+    file_path: Optional[str],
+    user_id: int,
+    executor: Executor,
+    future: Future
+) -> None:
+    """
+    Завершение задачи (выполняется в процессе API)
+
+    Итоговый статус пишется после сброса кеша (finish_job); задача
+    остается в _active_jobs до записи статуса.
+    """
+    if file_path:
+        release_temp_file(file_path)
+
+    # Воркер упал, не вернув итог (например, BrokenProcessPool)
+    error = None if future.cancelled() else future.exception()
+    if isinstance(error, BrokenProcessPool):
+        _reset_executor(executor)
+    if future.cancelled() or error is not None:
+        logger.error(f"Ingestion job {job_id} crashed: {error}")
+        result = {"status": "failed", "error": "File processing failed", "finished_at": _now()}
+    else:
+        result = future.result()
+
+    try:
+        finish_job(job_id, user_id, result)
+    except Exception as e:
+        logger.error(f"Ingestion job {job_id} status update failed: {str(e)}")
+    finally:
+        _active_jobs.pop(job_id, None)
@@ -0,0 +1,63 @@
+"""
+Keyset (cursor) пагинация записей по (date_field, id)
+"""
+import base64
+import json
+from datetime import date
+from typing import Optional, Tuple, List
+
+from fastapi import HTTPException, status
+from sqlalchemy import and_, tuple_
+
+from models import Record
+
+
+def encode_cursor(date_field: Optional[date], record_id: int) -> str:
+    """
+    Курсор на позицию после записи (непрозрачная строка для клиента)
+
+    Args:
+        date_field: Дата последней записи страницы
+        record_id: ID последней записи страницы
+    """
+    payload = {"d": date_field.isoformat() if date_field else None, "i": record_id}
+    return base64.urlsafe_b64encode(json.dumps(payload).encode()).decode().rstrip("=")
+
+
+def decode_cursor(cursor: str) -> Tuple[Optional[date], int]:
+    """
+    Разбор курсора
+
+    Returns:
+        Tuple[date_field, id] последней записи предыдущей страницы
+    """
+    try:
+        padded = cursor + "=" * (-len(cursor) % 4)
+        payload = json.loads(base64.urlsafe_b64decode(padded.encode()))
+        date_value = date.fromisoformat(payload["d"]) if payload["d"] else None
+        return date_value, int(payload["i"])
+    except (ValueError, KeyError, TypeError):
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="Invalid cursor"
+        )
+
+
+def records_after(cursor_date: Optional[date], cursor_id: int) -> List:
+    """
+    Условия "после курсора" для порядка date_field DESC NULLS LAST, id DESC
+
+    Возвращаются фазы, которые читаются по очереди, пока страница не заполнится:
+    записи с датой до курсора, затем хвост записей без даты. Каждая фаза -
+    диапазон индекса idx_records_date_desc_id (условие с OR им бы не было).
+    """
+    null_tail = Record.date_field.is_(None)
+
+    if cursor_date is None:
+        # Курсор уже в хвосте без дат
+        return [and_(null_tail, Record.id < cursor_id)]
+
+    return [
+        tuple_(Record.date_field, Record.id) < tuple_(cursor_date, cursor_id),
+        null_tail
+    ]
@@ -0,0 +1,179 @@
+"""
+Секционирование таблицы records по периоду (PostgreSQL, LIST по period)
+"""
+import os
+import re
+from typing import Iterable, List, Dict, Any
+
+from loguru import logger
+from sqlalchemy import text, delete
+from sqlalchemy.schema import CreateColumn, CreateIndex
+
+from models import Record, PeriodStat
+
+# none - обычная таблица, period - секция на каждый месяц (только для новой БД)
+RECORDS_PARTITIONING = os.getenv("RECORDS_PARTITIONING", "none").lower()
+
+# Секция для записей без даты и секция по умолчанию (периоды без своей секции)
+NO_PERIOD_PARTITION = "records_no_period"
+DEFAULT_PARTITION = "records_default"
+
+PERIOD_RE = re.compile(r'^\d{4}-\d{2}$')
+
+# Секции, уже проверенные в этом процессе
+_known_partitions = set()
+
+
+def partition_name(period: str) -> str:
+    """Имя секции периода: 2025-01 -> records_p2025_01"""
+    return "records_p" + period.replace("-", "_")
+
+
+def partitioning_enabled(engine) -> bool:
+    """Секционирование включено и поддерживается диалектом"""
+    return RECORDS_PARTITIONING == "period" and engine.dialect.name == "postgresql"
+
+
+def is_partitioned(conn) -> bool:
+    """records уже создана как секционированная таблица"""
+    return bool(conn.execute(text(
+        "SELECT 1 FROM pg_partitioned_table p JOIN pg_class c ON c.oid = p.partrelid "
+        "WHERE c.relname = 'records' AND pg_table_is_visible(c.oid)"
+    )).scalar())
+
+
+def create_partitioned_records_table(engine) -> None:
+    """
+    Создание records как секционированной таблицы (PARTITION BY LIST (period))
+
+    Колонки и индексы берутся из модели Record. Первичного ключа на уровне
+    БД нет (он должен включать ключ секционирования, а period допускает NULL),
+    поиск по id идет через индекс ix_records_id. Индексы создаются
+    на родительской таблице и наследуются секциями.
+    Существующая обычная таблица records не преобразуется.
+    """
+    with engine.begin() as conn:
+        exists = conn.execute(text("SELECT to_regclass('records')")).scalar()
+        if exists:
+            if not is_partitioned(conn):
+                logger.warning(
+                    "RECORDS_PARTITIONING=period is ignored: table records already exists "
+                    "and is not partitioned (migrate it manually)"
+                )
+            return
+
+        table = Record.__table__
+        columns = [str(CreateColumn(column).compile(dialect=conn.dialect)) for column in table.columns]
+        columns.append("FOREIGN KEY (file_id) REFERENCES files (id) ON DELETE CASCADE")
+
+        conn.execute(text(
+            "CREATE TABLE records (\n    " + ",\n    ".join(columns) + "\n) PARTITION BY LIST (period)"
+        ))
+        for index in table.indexes:
+            conn.execute(CreateIndex(index, if_not_exists=True))
+
+        conn.execute(text(f"CREATE TABLE {NO_PERIOD_PARTITION} PARTITION OF records FOR VALUES IN (NULL)"))
+        conn.execute(text(f"CREATE TABLE {DEFAULT_PARTITION} PARTITION OF records DEFAULT"))
+
+    logger.info("Created partitioned table records (LIST by period)")
+
+
+def ensure_period_partitions(engine, periods: Iterable[str]) -> List[str]:
+    """
+    Создание секций для новых периодов
+
+    Вызывается после коммита загрузки: записи периода без своей секции
+    попадают в секцию по умолчанию и здесь переносятся в новую секцию,
+    которая затем подключается (ATTACH PARTITION). DDL не выполняется
+    внутри транзакции загрузки, чтобы не держать блокировку records.
+
+    Args:
+        engine: Engine основной БД
+        periods: Периоды (YYYY-MM) загруженных записей
+
+    Returns:
+        Имена созданных секций
+    """
+    if not partitioning_enabled(engine):
+        return []
+
+    created = []
+    for period in sorted(set(periods)):
+        if not period or not PERIOD_RE.match(period) or period in _known_partitions:
+            continue
+
+        name = partition_name(period)
+        with engine.begin() as conn:
+            # Одна секция создается одним процессом
+            conn.execute(text("SELECT pg_advisory_xact_lock(hashtext(:name))"), {"name": name})
+
+            if conn.execute(text("SELECT to_regclass(:name)"), {"name": name}).scalar() is None:
+                conn.execute(text(f"CREATE TABLE {name} (LIKE records INCLUDING DEFAULTS)"))
+                conn.execute(text(
+                    f"ALTER TABLE {name} ADD CONSTRAINT {name}_period_check "
+                    f"CHECK (period IS NOT NULL AND period = '{period}')"
+                ))
+                conn.execute(text(
+                    f"WITH moved AS (DELETE FROM {DEFAULT_PARTITION} WHERE period = :period RETURNING *) "
+                    f"INSERT INTO {name} SELECT * FROM moved"
+                ), {"period": period})
+                conn.execute(text(f"ALTER TABLE records ATTACH PARTITION {name} FOR VALUES IN ('{period}')"))
+                created.append(name)
+
+        _known_partitions.add(period)
+
+    if created:
+        logger.info(f"Created record partitions: {', '.join(created)}")
+    return created
+
+
+def list_period_partitions(engine) -> List[Dict[str, Any]]:
+    """Секции records с периодом и примерным числом строк"""
+    if not partitioning_enabled(engine):
+        return []
+
+    with engine.connect() as conn:
+        rows = conn.execute(text(
+            "SELECT c.relname, pg_get_expr(c.relpartbound, c.oid), c.reltuples::bigint "
+            "FROM pg_inherits i JOIN pg_class c ON c.oid = i.inhrelid "
+            "WHERE i.inhparent = 'records'::regclass ORDER BY c.relname"
+        )).all()
+
+    return [
+        {"partition": name, "bound": bound, "estimated_rows": max(estimated, 0)}
+        for name, bound, estimated in rows
+    ]
+
+
+def drop_period_partition(engine, period: str) -> List[int]:
+    """
+    Удаление всех записей периода целой секцией (DETACH + DROP)
+
+    Сводка period_stats по периоду удаляется в той же транзакции.
+
+    Args:
+        engine: Engine основной БД
+        period: Период (YYYY-MM)
+
+    Returns:
+        ID пользователей, у которых были записи периода (для сброса кеша)
+    """
+    if not partitioning_enabled(engine):
+        raise ValueError("Records partitioning is not enabled")
+    if not PERIOD_RE.match(period):
+        raise ValueError(f"Invalid period: {period}")
+
+    name = partition_name(period)
+    with engine.begin() as conn:
+        if conn.execute(text("SELECT to_regclass(:name)"), {"name": name}).scalar() is None:
+            raise ValueError(f"Partition for period {period} does not exist")
+
+        user_ids = conn.execute(
+            delete(PeriodStat).where(PeriodStat.period == period).returning(PeriodStat.user_id)
+        ).scalars().all()
+        conn.execute(text(f"ALTER TABLE records DETACH PARTITION {name}"))
+        conn.execute(text(f"DROP TABLE {name}"))
+
+    _known_partitions.discard(period)
+    logger.info(f"Dropped record partition {name}")
+    return list(user_ids)
@@ -0,0 +1,104 @@
+"""
+Сводная статистика записей по периодам (таблица period_stats)
+"""
+from typing import List, Dict, Tuple
+
+from sqlalchemy import func, select, insert
+from sqlalchemy.engine import Connection
+from sqlalchemy.orm import Session
+
+from models import File, Record, PeriodStat
+
+# Период для записей без даты
+NO_PERIOD = ''
+
+
+def _insert(db: Session):
+    """INSERT с поддержкой ON CONFLICT для текущего диалекта"""
+    if db.get_bind().dialect.name == "sqlite":
+        from sqlalchemy.dialects.sqlite import insert
+    else:
+        from sqlalchemy.dialects.postgresql import insert
+    return insert(PeriodStat)
+
+
+def add_period_counts(db: Session, user_id: int, counts: Dict[str, int]) -> None:
+    """
+    Увеличение счетчиков периодов (в транзакции загрузки файла)
+
+    Args:
+        db: Database session
+        user_id: ID пользователя
+        counts: Количество добавленных записей по периодам
+    """
+    # Строки блокируются в порядке периодов: параллельные загрузки не взаимоблокируются
+    values = [
+        {"user_id": user_id, "period": period, "record_count": count}
+        for period, count in sorted(counts.items()) if count
+    ]
+    if not values:
+        return
+
+    stmt = _insert(db).values(values)
+    stmt = stmt.on_conflict_do_update(
+        index_elements=[PeriodStat.user_id, PeriodStat.period],
+        set_={"record_count": PeriodStat.record_count + stmt.excluded.record_count}
+    )
+    db.execute(stmt)
+
+
+def subtract_period_counts(db: Session, user_id: int, counts: Dict[str, int]) -> None:
+    """
+    Уменьшение счетчиков периодов (в транзакции удаления записей)
+
+    Args:
+        db: Database session
+        user_id: ID владельца записей
+        counts: Количество удаленных записей по периодам
+    """
+    for period, count in counts.items():
+        if not count:
+            continue
+        db.query(PeriodStat).filter(
+            PeriodStat.user_id == user_id,
+            PeriodStat.period == period
+        ).update({"record_count": PeriodStat.record_count - count}, synchronize_session=False)
+
+    db.query(PeriodStat).filter(
+        PeriodStat.user_id == user_id,
+        PeriodStat.record_count <= 0
+    ).delete(synchronize_session=False)
+
+
+def backfill_period_stats(conn: Connection) -> None:
+    """
+    Заполнение сводки по всем записям таблицы records (одним INSERT ... SELECT)
+
+    Выполняется один раз при создании таблицы period_stats (init_db), чтобы
+    сводка включала данные, загруженные до ее появления.
+    """
+    period = func.coalesce(Record.period, NO_PERIOD)
+    counts = select(
+        File.user_id,
+        period,
+        func.count(Record.id)
+    ).join(File, File.id == Record.file_id).group_by(File.user_id, period)
+
+    conn.execute(PeriodStat.__table__.delete())
+    conn.execute(insert(PeriodStat).from_select(
+        ["user_id", "period", "record_count"], counts
+    ))
+
+
+def get_period_counts(db: Session, user_id: int) -> List[Tuple[str, int]]:
+    """
+    Количество записей пользователя по периодам (новые периоды первыми)
+
+    Returns:
+        Список (period, count); период NO_PERIOD - записи без даты
+    """
+    rows = db.query(PeriodStat.period, PeriodStat.record_count).filter(
+        PeriodStat.user_id == user_id
+    ).order_by(PeriodStat.period.desc()).all()
+
+    return [(period, count) for period, count in rows]
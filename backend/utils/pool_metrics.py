@@ -0,0 +1,139 @@
+"""
+Метрики пула соединений SQLAlchemy (выдача, ожидание, overflow, pre-ping)
+"""
+import threading
+import time
+from typing import Any, Dict
+
+from sqlalchemy import event, exc
+
+# Метрики всех пулов по имени engine'а
+_registry: Dict[str, "PoolMetrics"] = {}
+
+
+class PoolMetrics:
+    """Счетчики одного пула"""
+
+    def __init__(self, name: str):
+        self.name = name
+        self.pool = None
+        self._lock = threading.Lock()
+        self.checkouts = 0
+        self.checkins = 0
+        self.connects = 0
+        self.timeouts = 0
+        self.pre_ping_failures = 0
+        self.invalidations = 0
+        self.total_wait_seconds = 0.0
+        self.max_wait_seconds = 0.0
+        self.max_overflow_used = 0
+
+    def record_wait(self, seconds: float) -> None:
+        with self._lock:
+            self.checkouts += 1
+            self.total_wait_seconds += seconds
+            self.max_wait_seconds = max(self.max_wait_seconds, seconds)
+
+    def record(self, counter: str) -> None:
+        with self._lock:
+            setattr(self, counter, getattr(self, counter) + 1)
+
+    def record_overflow(self, overflow: int) -> None:
+        with self._lock:
+            self.max_overflow_used = max(self.max_overflow_used, overflow)
+
+    def snapshot(self) -> Dict[str, Any]:
+        """Текущее состояние пула и накопленные счетчики"""
+        pool = self.pool
+        with self._lock:
+            result = {
+                "checkouts": self.checkouts,
+                "checkins": self.checkins,
+                "connects": self.connects,
+                "timeouts": self.timeouts,
+                "pre_ping_failures": self.pre_ping_failures,
+                "invalidations": self.invalidations,
+                "avg_wait_seconds": round(self.total_wait_seconds / self.checkouts, 6) if self.checkouts else 0.0,
+                "max_wait_seconds": round(self.max_wait_seconds, 6),
+                "max_overflow_used": self.max_overflow_used,
+            }
+
+        # Текущее состояние есть только у QueuePool
+        if pool is not None and hasattr(pool, "overflow"):
+            result.update({
+                "pool_size": pool.size(),
+                "checked_out": pool.checkedout(),
+                "checked_in": pool.checkedin(),
+                "overflow": max(pool.overflow(), 0),
+                "max_overflow": pool._max_overflow,
+                "timeout": pool.timeout(),
+            })
+        return result
+
+
+def instrumented_pool_class(base, metrics: PoolMetrics):
+    """
+    Подкласс пула, замеряющий время получения соединения
+
+    Время - от запроса соединения до выдачи: ожидание в очереди,
+    открытие нового соединения и pre-ping. Класс сохраняется
+    при пересоздании пула (Pool.recreate).
+    """
+    def connect(self):
+        started = time.perf_counter()
+        try:
+            connection = base.connect(self)
+        except exc.TimeoutError:
+            metrics.record("timeouts")
+            raise
+        metrics.record_wait(time.perf_counter() - started)
+        return connection
+
+    return type(f"Instrumented{base.__name__}", (base,), {"connect": connect})
+
+
+def instrument_engine(engine, metrics: PoolMetrics) -> None:
+    """
+    Подписка метрик на события engine'а и его пула
+
+    Args:
+        engine: Engine (для AsyncEngine - engine.sync_engine)
+        metrics: Счетчики пула
+    """
+    metrics.pool = engine.pool
+
+    @event.listens_for(engine, "connect")
+    def on_connect(dbapi_connection, connection_record):
+        metrics.record("connects")
+
+    @event.listens_for(engine, "checkout")
+    def on_checkout(dbapi_connection, connection_record, connection_proxy):
+        pool = engine.pool
+        metrics.pool = pool
+        if hasattr(pool, "overflow"):
+            metrics.record_overflow(pool.overflow())
+
+    @event.listens_for(engine, "checkin")
+    def on_checkin(dbapi_connection, connection_record):
+        metrics.record("checkins")
+
+    @event.listens_for(engine, "invalidate")
+    def on_invalidate(dbapi_connection, connection_record, exception):
+        metrics.record("invalidations")
+
+    @event.listens_for(engine, "handle_error")
+    def on_error(context):
+        if context.is_pre_ping:
+            metrics.record("pre_ping_failures")
+
+
+def get_pool_metrics(name: str) -> PoolMetrics:
+    """Счетчики пула по имени (создаются при первом обращении)"""
+    if name not in _registry:
+        _registry[name] = PoolMetrics(name)
+    return _registry[name]
+
+
+def pool_metrics_snapshot() -> Dict[str, Dict[str, Any]]:
+    """Метрики всех пулов"""
+    return {name: metrics.snapshot() for name, metrics in _registry.items()}
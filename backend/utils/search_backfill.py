@@ -0,0 +1,82 @@
+"""
+Заполнение records.search_text для записей, загруженных до появления поиска
+"""
+import os
+import threading
+
+from loguru import logger
+from sqlalchemy import text
+
+# Количество записей, обновляемых одним UPDATE
+SEARCH_BACKFILL_BATCH_SIZE = int(os.getenv("SEARCH_BACKFILL_BATCH_SIZE", "10000"))
+
+# Тот же текст, что и build_search_text: непустые значения строки через \n
+# в нижнем регистре (json_each_text раскодирует \uXXXX в старых записях).
+# search_text вида '{...' - результат прежнего заполнения lower(data::text).
+# Условие совпадает с частичным индексом idx_records_search_pending: пакет
+# выбирается по индексу, а не просмотром таблицы.
+_BACKFILL_BATCH = text("""
+    WITH batch AS (
+        SELECT id FROM records
+        WHERE id > :after_id
+          AND data IS NOT NULL
+          AND (search_text IS NULL OR search_text LIKE '{%')
+        ORDER BY id
+        LIMIT :batch_size
+    )
+    UPDATE records SET search_text = coalesce((
+        SELECT lower(string_agg(value, E'\\n'))
+        FROM json_each_text(records.data::json)
+        WHERE value <> ''
+    ), '')
+    FROM batch
+    WHERE records.id = batch.id
+    RETURNING records.id
+""")
+
+
+def backfill_search_text(engine) -> int:
+    """
+    Заполнение search_text пакетами по возрастанию id (только PostgreSQL)
+
+    Выбираются только записи без search_text, поэтому после заполнения
+    повторный запуск сводится к одному пустому пакету. Каждый пакет -
+    отдельная транзакция: таблица не блокируется целиком, а прерванное
+    заполнение продолжается при следующем запуске.
+
+    Returns:
+        Количество обновленных записей
+    """
+    if engine.dialect.name != "postgresql":
+        return 0
+
+    updated = 0
+    after_id = 0
+    while True:
+        with engine.begin() as conn:
+            ids = conn.execute(_BACKFILL_BATCH, {
+                "after_id": after_id,
+                "batch_size": SEARCH_BACKFILL_BATCH_SIZE
+            }).scalars().all()
+        if not ids:
+            break
+        updated += len(ids)
+        # Значение вида '{...' могло остаться и после пересчета - такие записи пропускаются
+        after_id = max(ids)
+
+    if updated:
+        logger.info(f"search_text backfilled for {updated} records")
+    return updated
+
+
+def start_search_text_backfill(engine) -> threading.Thread:
+    """Заполнение search_text в фоновом потоке (не задерживает запуск API)"""
+    def run():
+        try:
+            backfill_search_text(engine)
+        except Exception as e:
+            logger.error(f"search_text backfill failed: {str(e)}")
+
+    thread = threading.Thread(target=run, name="search-backfill", daemon=True)
+    thread.start()
+    return thread
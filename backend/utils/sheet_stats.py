@@ -0,0 +1,99 @@
+"""
+Векторизованная статистика по строкам листа (pandas)
+"""
+from typing import List, Iterable, Dict, Any
+
+import pandas as pd
+
+from utils.excel_parser import parse_date_cell
+
+# Количество строк в одном DataFrame при расчете по итератору
+STATS_CHUNK_SIZE = 50_000
+
+
+class SheetStatsAccumulator:
+    """
+    Накопление статистики по пакетам строк
+
+    Результат совпадает по формату с validate_excel_structure, но типы
+    считаются по колонкам целиком: каждое уникальное значение колонки
+    проверяется один раз (числа - через pd.to_numeric, даты - парсером дат).
+    """
+
+    def __init__(self, headers: List[str]):
+        self.headers = headers
+        self.total_rows = 0
+        self.empty_cells = 0
+        self.column_types: Dict[str, Dict[str, int]] = {}
+
+    def update(self, rows: List[List[Any]]) -> None:
+        """
+        Добавить пакет строк в статистику
+
+        Args:
+            rows: Строки данных
+        """
+        if not rows:
+            return
+
+        frame = pd.DataFrame(rows, dtype=object)
+        self.total_rows += len(frame)
+
+        for i in frame.columns:
+            # None - ячейки нет в строке (строка короче остальных)
+            values = frame[i].dropna()
+            if values.empty:
+                continue
+
+            col_name = self.headers[i] if i < len(self.headers) else f"Column_{i+1}"
+            counts = self.column_types.setdefault(col_name, {"numeric": 0, "text": 0, "date": 0})
+
+            self.empty_cells += int((values == '').sum())
+
+            # Типы определяются по уникальным значениям колонки
+            uniques = pd.Series(pd.unique(values), dtype=object)
+            numeric_uniques = pd.to_numeric(uniques, errors='coerce').notna()
+
+            numeric = values.isin(uniques[numeric_uniques])
+            counts["numeric"] += int(numeric.sum())
+
+            candidates = values[~numeric]
+            date_values = [value for value in uniques[~numeric_uniques] if parse_date_cell(value)]
+            dates = int(candidates.isin(date_values).sum()) if date_values else 0
+
+            counts["date"] += dates
+            counts["text"] += len(candidates) - dates
+
+    def result(self) -> Dict[str, Any]:
+        """Итоговая статистика по файлу"""
+        return {
+            "total_columns": len(self.headers),
+            "total_rows": self.total_rows,
+            "empty_cells": self.empty_cells,
+            "has_dates": any(counts["date"] for counts in self.column_types.values()),
+            "column_types": self.column_types
+        }
+
+
+def compute_sheet_stats(headers: List[str], rows: Iterable[List[Any]]) -> Dict[str, Any]:
+    """
+    Статистика по файлу за один проход (векторизованный аналог validate_excel_structure)
+
+    Args:
+        headers: Заголовки колонок
+        rows: Строки данных (список или генератор)
+
+    Returns:
+        Статистика по файлу
+    """
+    accumulator = SheetStatsAccumulator(headers)
+
+    chunk = []
+    for row in rows:
+        chunk.append(row)
+        if len(chunk) >= STATS_CHUNK_SIZE:
+            accumulator.update(chunk)
+            chunk = []
+    accumulator.update(chunk)
+
+    return accumulator.result()
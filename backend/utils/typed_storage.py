@@ -0,0 +1,92 @@
+"""
+Типизированное хранение строк: значения массивом (Record.cells), заголовки - в File.headers
+"""
+import os
+from datetime import datetime, date, time
+from typing import List, Any, Dict, Optional
+
+# json - Record.data со строковыми значениями, typed - Record.cells с исходными типами
+STORAGE_MODE = os.getenv("STORAGE_MODE", "json").lower()
+
+
+def typed_storage_enabled() -> bool:
+    """Новые файлы сохраняются в типизированном виде"""
+    return STORAGE_MODE == "typed"
+
+
+def cell_kind(value: Any) -> Optional[str]:
+    """Тип значения ячейки: number, date, bool, text (None - пустая ячейка)"""
+    if value is None or value == '':
+        return None
+    if isinstance(value, bool):
+        return "bool"
+    if isinstance(value, (int, float)):
+        return "number"
+    if isinstance(value, (datetime, date)):
+        return "date"
+    return "text"
+
+
+def serialize_cell(value: Any) -> Any:
+    """
+    Значение ячейки для JSON
+
+    Числа и bool остаются как есть, даты - ISO строкой
+    (без времени, если оно нулевое), время - HH:MM:SS.
+    """
+    if isinstance(value, datetime):
+        if value.time() == time(0, 0):
+            return value.date().isoformat()
+        return value.isoformat(sep=" ")
+    if isinstance(value, (date, time)):
+        return value.isoformat()
+    if isinstance(value, float) and value.is_integer():
+        return int(value)
+    return value
+
+
+class ColumnTypeAccumulator:
+    """
+    Определение типа колонок по всем строкам файла
+
+    Тип колонки - общий тип ее непустых значений; при смешанных
+    типах колонка считается текстовой, без значений - empty.
+    """
+
+    def __init__(self, headers: List[str]):
+        self.headers = headers
+        self._kinds: List[set] = [set() for _ in headers]
+
+    def update(self, row: List[Any]) -> None:
+        for kinds, value in zip(self._kinds, row):
+            kind = cell_kind(value)
+            if kind is not None and len(kinds) < 2:
+                kinds.add(kind)
+
+    def result(self) -> Dict[str, str]:
+        """Тип по каждому заголовку"""
+        types = {}
+        for header, kinds in zip(self.headers, self._kinds):
+            if not kinds:
+                types[header] = "empty"
+            elif len(kinds) == 1:
+                types[header] = next(iter(kinds))
+            else:
+                types[header] = "text"
+        return types
+
+
+def record_data(data: Optional[Dict[str, Any]], cells: Optional[List[Any]], headers: Optional[List[str]]) -> Dict[str, Any]:
+    """
+    Данные записи словарем {заголовок: значение} для любого режима хранения
+
+    Args:
+        data: Record.data (режим json)
+        cells: Record.cells (режим typed)
+        headers: File.headers
+    """
+    if data is not None:
+        return data
+    if cells is None:
+        return {}
+    return {header: value for header, value in zip(headers or [], cells)}
@@ -0,0 +1,118 @@
+"""
+Сохранение загружаемых файлов во временные файлы на диске
+"""
+import hashlib
+import os
+import tempfile
+import threading
+from collections import Counter
+from typing import Optional, Tuple
+
+from fastapi import HTTPException, UploadFile, status
+
+# Максимальный размер загружаемого файла
+MAX_UPLOAD_SIZE_MB = int(os.getenv("MAX_UPLOAD_SIZE_MB", "100"))
+MAX_UPLOAD_SIZE = MAX_UPLOAD_SIZE_MB * 1024 * 1024
+
+# Размер блока копирования (1 МБ)
+UPLOAD_CHUNK_SIZE = 1024 * 1024
+
+# Допустимые расширения загружаемых файлов (формат определяется по содержимому)
+UPLOAD_EXTENSIONS = ('.xlsx', '.xls', '.csv')
+
+# Директория для временных файлов (по умолчанию системная)
+UPLOAD_TMP_DIR = os.getenv("UPLOAD_TMP_DIR") or None
+
+# Максимальное количество файлов в одной пакетной загрузке
+MAX_BATCH_FILES = int(os.getenv("MAX_BATCH_FILES", "50"))
+
+# Ссылки на временные файлы: один файл читают задачи всех его листов
+_temp_file_refs: Counter = Counter()
+_temp_file_lock = threading.Lock()
+
+
+def check_upload_extension(filename: Optional[str]) -> None:
+    """Проверка расширения загружаемого файла (400, если формат не поддерживается)"""
+    if not (filename or "").lower().endswith(UPLOAD_EXTENSIONS):
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=f"Only Excel or CSV files (.xlsx, .xls, .csv) are allowed: {filename}"
+        )
+
+
+def upload_too_large() -> HTTPException:
+    """Ошибка превышения максимального размера файла"""
+    return HTTPException(
+        status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE,
+        detail=f"File is too large (max {MAX_UPLOAD_SIZE_MB} MB)"
+    )
+
+
+async def spool_upload_to_disk(upload: UploadFile, max_size: Optional[int] = None) -> Tuple[str, str]:
+    """
+    Копирование загруженного файла во временный файл блоками
+
+    Файл никогда не читается в память целиком; при превышении
+    max_size копирование прерывается и временный файл удаляется.
+    Попутно считается SHA-256 содержимого (отпечаток файла).
+
+    Args:
+        upload: Загруженный файл
+        max_size: Максимальный размер в байтах (по умолчанию MAX_UPLOAD_SIZE)
+
+    Returns:
+        Tuple[path, content_hash]: Путь к временному файлу (удаляет
+        вызывающий код) и SHA-256 содержимого
+    """
+    max_size = max_size or MAX_UPLOAD_SIZE
+
+    # Размер уже известен после разбора multipart
+    if upload.size is not None and upload.size > max_size:
+        raise upload_too_large()
+
+    suffix = os.path.splitext(upload.filename or "")[1]
+    fd, path = tempfile.mkstemp(prefix="vendhub_upload_", suffix=suffix, dir=UPLOAD_TMP_DIR)
+
+    content_hash = hashlib.sha256()
+
+    try:
+        written = 0
+        with os.fdopen(fd, "wb") as out:
+            while True:
+                chunk = await upload.read(UPLOAD_CHUNK_SIZE)
+                if not chunk:
+                    break
+                written += len(chunk)
+                if written > max_size:
+                    raise upload_too_large()
+                content_hash.update(chunk)
+                out.write(chunk)
+    except BaseException:
+        remove_temp_file(path)
+        raise
+
+    return path, content_hash.hexdigest()
+
+
+def retain_temp_file(path: str) -> None:
+    """Взять ссылку на временный файл (файл не удаляется, пока есть ссылки)"""
+    with _temp_file_lock:
+        _temp_file_refs[path] += 1
+
+
+def release_temp_file(path: str) -> None:
+    """Освободить ссылку на временный файл; последняя ссылка удаляет файл"""
+    with _temp_file_lock:
+        _temp_file_refs[path] -= 1
+        if _temp_file_refs[path] > 0:
+            return
+        del _temp_file_refs[path]
+    remove_temp_file(path)
+
+
+def remove_temp_file(path: str) -> None:
+    """Удаление временного файла (без ошибки, если его уже нет)"""
+    try:
+        os.remove(path)
+    except FileNotFoundError:
+        pass
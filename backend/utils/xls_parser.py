@@ -0,0 +1,97 @@
+"""
+Чтение Excel 97-2003 (.xls) через xlrd
+"""
+from typing import Any, Callable, Iterator, List, Optional, Tuple, Union, BinaryIO
+
+import xlrd
+
+
+def _open_book(source: Union[bytes, str, BinaryIO]) -> xlrd.Book:
+    """Открытие книги .xls (листы загружаются по требованию)"""
+    try:
+        if isinstance(source, str):
+            return xlrd.open_workbook(source, on_demand=True)
+        if not isinstance(source, bytes):
+            source = source.read()
+        return xlrd.open_workbook(file_contents=source, on_demand=True)
+    except xlrd.XLRDError as e:
+        raise ValueError(f"Не удалось прочитать .xls файл: {e}")
+
+
+def _cell_value(cell: xlrd.sheet.Cell, datemode: int) -> Any:
+    """
+    Значение ячейки в типах openpyxl
+
+    Даты - datetime, целые числа - int, логические - bool,
+    пустые ячейки и ошибки - None.
+    """
+    ctype = cell.ctype
+    if ctype in (xlrd.XL_CELL_EMPTY, xlrd.XL_CELL_BLANK, xlrd.XL_CELL_ERROR):
+        return None
+    if ctype == xlrd.XL_CELL_DATE:
+        try:
+            return xlrd.xldate.xldate_as_datetime(cell.value, datemode)
+        except (xlrd.xldate.XLDateError, OverflowError):
+            return cell.value
+    if ctype == xlrd.XL_CELL_BOOLEAN:
+        return bool(cell.value)
+    if ctype == xlrd.XL_CELL_NUMBER and cell.value.is_integer():
+        return int(cell.value)
+    return cell.value
+
+
+def list_xls_sheets(source: Union[bytes, str, BinaryIO]) -> List[str]:
+    """Имена видимых листов книги .xls в порядке книги"""
+    book = _open_book(source)
+    try:
+        names = []
+        for index, name in enumerate(book.sheet_names()):
+            if book.sheet_by_index(index).visibility == 0:
+                names.append(name)
+            book.unload_sheet(index)
+        return names
+    finally:
+        book.release_resources()
+
+
+def first_xls_sheet(source: Union[bytes, str, BinaryIO]) -> str:
+    """Имя первого листа книги .xls (лист open_xls_rows по умолчанию)"""
+    book = _open_book(source)
+    try:
+        return book.sheet_names()[0]
+    finally:
+        book.release_resources()
+
+
+def open_xls_rows(
+    source: Union[bytes, str, BinaryIO],
+    sheet: Optional[str] = None
+) -> Tuple[Iterator[Tuple[Any, ...]], Callable[[], None]]:
+    """
+    Строки листа книги .xls
+
+    xlrd читает лист целиком, но формат .xls ограничен 65536 строками.
+
+    Args:
+        source: Байты файла, путь к файлу или file-like объект
+        sheet: Имя листа (по умолчанию первый лист)
+
+    Returns:
+        Tuple[rows, close]: Генератор строк (кортежи значений) и функция
+        освобождения книги
+    """
+    book = _open_book(source)
+
+    if sheet is None:
+        worksheet = book.sheet_by_index(0)
+    elif sheet in book.sheet_names():
+        worksheet = book.sheet_by_name(sheet)
+    else:
+        book.release_resources()
+        raise ValueError(f"Лист не найден: {sheet}")
+
+    def rows() -> Iterator[Tuple[Any, ...]]:
+        for index in range(worksheet.nrows):
+            yield tuple(_cell_value(cell, book.datemode) for cell in worksheet.row(index))
+
+    return rows(), book.release_resources